@@ -1,6 +1,7 @@
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from flask_compress import Compress
 import os
 from datetime import datetime
 from config import config
@@ -10,6 +11,8 @@ from routes.student import student_bp
 from routes.teacher import teacher_bp
 from routes.manager import manager_bp
 from decorators import init_redis
+from json_provider import ORJSONProvider, format_timestamp
+from query_counter import init_query_counter
 from flask_migrate import Migrate
 from sqlalchemy.exc import OperationalError
 import time
@@ -22,6 +25,9 @@ def create_app(config_name=None):
     config_name = config_name or os.getenv('FLASK_ENV', 'development')
     app.config.from_object(config[config_name])
     
+    # Serialize/parse JSON with orjson instead of the stdlib json module
+    app.json = ORJSONProvider(app)
+    
     # Initialize extensions
     db.init_app(app)
     with app.app_context():
@@ -36,10 +42,14 @@ def create_app(config_name=None):
     migrate = Migrate(app, db)  # Initialize Flask-Migrate
     jwt = JWTManager(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
+    Compress(app)
     
     # Initialize Redis for token blacklist
     init_redis(app)
     
+    # Per-request SQL statement counting (development/testing only)
+    init_query_counter(app)
+    
     # JWT Error Handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -51,7 +61,7 @@ def create_app(config_name=None):
                 'token_type': jwt_payload.get('type', 'access'),
                 'action_required': 'Use refresh token to get new access token or login again'
             },
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': format_timestamp(),
             'status_code': 401
         }), 401
 
@@ -64,7 +74,7 @@ def create_app(config_name=None):
     #             'reason': str(error),
     #             'action_required': 'Please provide a valid JWT token'
     #         },
-    #         'timestamp': datetime.utcnow().isoformat(),
+    #         'timestamp': datetime.utcnow(),
     #         'status_code': 401
     #     }), 401
 
@@ -78,7 +88,7 @@ def create_app(config_name=None):
                 'expected_format': 'Authorization: Bearer <your_jwt_token>',
                 'action_required': 'Please login to get an access token'
             },
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': format_timestamp(),
             'status_code': 401
         }), 401
 
@@ -91,7 +101,7 @@ def create_app(config_name=None):
                 'reason': 'This endpoint requires a fresh token for security',
                 'action_required': 'Please login again to get a fresh token'
             },
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': format_timestamp(),
             'status_code': 401
         }), 401
 
@@ -104,7 +114,7 @@ def create_app(config_name=None):
                 'reason': 'Token has been revoked (user logged out)',
                 'action_required': 'Please login again to get a new token'
             },
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': format_timestamp(),
             'status_code': 401
         }), 401
 
@@ -118,7 +128,7 @@ def create_app(config_name=None):
                 'reason': str(error.description) if hasattr(error, 'description') else 'Invalid request format or missing required fields',
                 'status_code': 400
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }), 400
 
     @app.errorhandler(404)
@@ -136,7 +146,7 @@ def create_app(config_name=None):
                 },
                 'status_code': 404
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }), 404
 
     @app.errorhandler(405)
@@ -149,7 +159,7 @@ def create_app(config_name=None):
                 'allowed_methods': list(error.valid_methods) if hasattr(error, 'valid_methods') else [],
                 'status_code': 405
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }), 405
 
     @app.errorhandler(500)
@@ -162,7 +172,7 @@ def create_app(config_name=None):
                 'action_required': 'Please try again later or contact administrator',
                 'status_code': 500
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }), 500
     
     # Register blueprints
@@ -181,7 +191,7 @@ def create_app(config_name=None):
         return {
             'status': 'healthy', 
             'message': 'School Management API is running',
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }, 200
     
     # Root endpoint
@@ -196,7 +206,7 @@ def create_app(config_name=None):
                 'teacher': '/api/teacher',
                 'manager': '/api/manager'
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': format_timestamp()
         }, 200
     
     return app
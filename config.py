@@ -12,6 +12,17 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'mysql+pymysql://myuser:101204@db:3306/school_management?charset=utf8mb4'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per worker process, sized above the gunicorn thread count
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        # Reuse the most recently returned connection so idle ones can time out
+        'pool_use_lifo': True,
+        # Room for every route's compiled statements in the engine's compiled cache
+        'query_cache_size': 1200
+    }
     
     # JWT config
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key'
@@ -26,8 +37,21 @@ class Config:
     # CORS config
     CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
 
+    # Response compression (Flask-Compress)
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIMETYPES = ['application/json']
+    COMPRESS_MIN_SIZE = 1024
+    # Leave streamed list responses streaming instead of buffering them to compress
+    COMPRESS_STREAMS = False
+
+    # Per-request SQL statement budget (None disables counting)
+    QUERY_BUDGET = None
+    # Turn lazy relationship loads into errors to catch N+1 patterns
+    SQLALCHEMY_RAISELOAD = False
+
 class DevelopmentConfig(Config):
     DEBUG = True
+    QUERY_BUDGET = 20
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -35,6 +59,9 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # In-memory SQLite uses a static pool that takes no sizing options
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    QUERY_BUDGET = 10
 
 config = {
     'development': DevelopmentConfig,
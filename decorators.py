@@ -1,40 +1,171 @@
 from functools import wraps
 from flask import jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from datetime import datetime
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
+import logging
+import os
+import threading
+import time
 import redis
-from models import User, UserType, Department
+from models import db, User, UserType
+from json_provider import format_timestamp
+
+logger = logging.getLogger(__name__)
 
 # Redis client for token blacklist
 redis_client = None
 
 def init_redis(app):
     global redis_client
-    redis_client = redis.from_url(app.config['REDIS_URL'])
+    # TCP keepalive, plus a PING before a command on a connection idle for
+    # 30s. The revocation subscription is watched separately (see
+    # _revocation_listener), since a blocked pub/sub read sends no commands
+    redis_client = redis.from_url(app.config['REDIS_URL'], socket_keepalive=True,
+                                  health_check_interval=30)
+
+# Revoked token ids mirrored in each worker (jti -> expiry timestamp): loaded
+# from Redis once and kept current through a pub/sub channel, so checking a
+# valid token needs no Redis round trip. While the subscription is down every
+# check goes to Redis as before
+_REVOCATION_CHANNEL = 'blacklist:revoked'
+_REVOCATION_RETRY_DELAY = 5
+# The listener PINGs its own subscription and drops it (falling back to Redis)
+# when nothing, not even the PONG, has arrived for _REVOCATION_REPLY_TIMEOUT
+# seconds: a half-open connection otherwise looks like a quiet channel
+_REVOCATION_PING_INTERVAL = 10
+_REVOCATION_REPLY_TIMEOUT = 25
+_revoked_jtis = {}
+_revoked_jtis_lock = threading.Lock()
+_revocation_feed_ready = threading.Event()
+_revocation_feed_pid = None
+
+def _remember_revoked(jti, ttl):
+    expires_at = time.time() + ttl if ttl >= 0 else float('inf')
+    with _revoked_jtis_lock:
+        _revoked_jtis[jti] = expires_at
+
+def _load_revocations(pubsub):
+    """Subscribe first, then copy the existing blacklist (revocations published meanwhile are buffered)"""
+    pubsub.subscribe(_REVOCATION_CHANNEL)
+    keys = list(redis_client.scan_iter(match='blacklist:*', count=1000))
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.ttl(key)
+    for key, ttl in zip(keys, pipe.execute()):
+        if ttl != -2:  # -2: expired since the scan
+            _remember_revoked(key.decode().split(':', 1)[1], ttl)
+
+def _revocation_listener():
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            _load_revocations(pubsub)
+            _revocation_feed_ready.set()
+            last_reply = next_ping = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if now - last_reply > _REVOCATION_REPLY_TIMEOUT:
+                    raise ConnectionError('no reply on the revocation subscription')
+                if now >= next_ping:
+                    pubsub.ping()
+                    next_ping = now + _REVOCATION_PING_INTERVAL
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                last_reply = time.monotonic()
+                if message['type'] == 'message':
+                    jti, _, ttl = message['data'].decode().rpartition(':')
+                    _remember_revoked(jti, int(ttl))
+        except Exception as e:
+            logger.warning(f"Token revocation feed lost: {str(e)}")
+        finally:
+            _revocation_feed_ready.clear()
+            pubsub.close()
+        time.sleep(_REVOCATION_RETRY_DELAY)
+
+def _ensure_revocation_feed():
+    """Start the revocation listener once per (forked) worker process"""
+    global _revocation_feed_pid
+    pid = os.getpid()
+    if _revocation_feed_pid == pid:
+        return
+    with _revoked_jtis_lock:
+        if _revocation_feed_pid == pid:
+            return
+        _revocation_feed_ready.clear()
+        _revoked_jtis.clear()
+        threading.Thread(target=_revocation_listener, name='token-revocations', daemon=True).start()
+        _revocation_feed_pid = pid
+
+def _is_revoked(jti):
+    """Blacklist check; raises if Redis has to be asked and cannot answer"""
+    _ensure_revocation_feed()
+    if _revocation_feed_ready.is_set():
+        with _revoked_jtis_lock:
+            expires_at = _revoked_jtis.get(jti)
+            if expires_at is None:
+                return False
+            if expires_at > time.time():
+                return True
+            del _revoked_jtis[jti]
+            return False
+    return redis_client.get(f"blacklist:{jti}") is not None
+
+def _token_revoked_response():
+    return jsonify({
+        'error': 'TOKEN_REVOKED',
+        'message': 'Token đã bị thu hồi. Vui lòng đăng nhập lại.',
+        'details': {
+            'reason': 'Token has been blacklisted (logged out)',
+            'action_required': 'Please login again to get a new token'
+        },
+        'timestamp': format_timestamp(),
+        'status_code': 401
+    }), 401
+
+def _token_validation_failed_response(error):
+    return jsonify({
+        'error': 'TOKEN_VALIDATION_FAILED',
+        'message': 'Xác thực token thất bại.',
+        'details': {
+            'reason': str(error),
+            'token_status': 'invalid_or_expired',
+            'action_required': 'Please login again to get a new token'
+        },
+        'timestamp': format_timestamp(),
+        'status_code': 401
+    }), 401
+
+def claims_required(f):
+    """Decorator to require valid JWT token, passing its claims instead of loading the user"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        verify_jwt_in_request()
+        claims = get_jwt()
+        # Fail closed like token_required when the blacklist cannot be checked
+        try:
+            revoked = _is_revoked(claims['jti'])
+        except Exception as e:
+            return _token_validation_failed_response(e)
+        if revoked:
+            return _token_revoked_response()
+        return f(claims, *args, **kwargs)
+    
+    return decorated
 
 def token_required(f):
     """Decorator to require valid JWT token"""
     @wraps(f)
-    @jwt_required()
     def decorated(*args, **kwargs):
+        # Raises the flask_jwt_extended errors handled in app.py on a bad token
+        verify_jwt_in_request()
         try:
             # Check if token is blacklisted
-            jti = get_jwt()['jti']
-            if redis_client.get(f"blacklist:{jti}"):
-                return jsonify({
-                    'error': 'TOKEN_REVOKED',
-                    'message': 'Token đã bị thu hồi. Vui lòng đăng nhập lại.',
-                    'details': {
-                        'reason': 'Token has been blacklisted (logged out)',
-                        'action_required': 'Please login again to get a new token'
-                    },
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'status_code': 401
-                }), 401
+            if _is_revoked(get_jwt()['jti']):
+                return _token_revoked_response()
             
             # Get current user
             current_user_id = get_jwt_identity()
-            current_user = User.query.get(current_user_id)
+            current_user = db.session.get(User, current_user_id)
             
             if not current_user:
                 return jsonify({
@@ -45,23 +176,13 @@ def token_required(f):
                         'reason': 'User account may have been deleted',
                         'action_required': 'Please contact administrator'
                     },
-                    'timestamp': datetime.utcnow().isoformat(),
+                    'timestamp': format_timestamp(),
                     'status_code': 404
                 }), 404
                 
             return f(current_user, *args, **kwargs)
         except Exception as e:
-            return jsonify({
-                'error': 'TOKEN_VALIDATION_FAILED',
-                'message': 'Xác thực token thất bại.',
-                'details': {
-                    'reason': str(e),
-                    'token_status': 'invalid_or_expired',
-                    'action_required': 'Please login again to get a new token'
-                },
-                'timestamp': datetime.utcnow().isoformat(),
-                'status_code': 401
-            }), 401
+            return _token_validation_failed_response(e)
     
     return decorated
 
@@ -72,15 +193,8 @@ def role_required(*allowed_roles):
         @token_required
         def decorated(current_user, *args, **kwargs):
             if current_user.user_type not in allowed_roles:
-                if current_user.teacher and current_user.teacher.department_id:
-                    department = Department.query.get(current_user.teacher.department_id)
-                    department_name = department.department_name 
-                elif current_user.teacher:
-                    department_name = current_user.teacher.department
-        
-                if current_user.student and current_user.student.department_id:
-                    department = Department.query.get(current_user.student.department_id)
-                    department_name = department.department_name 
+                # Department name was already resolved into the token claims at login
+                department_name = get_jwt().get('department')
                 return jsonify({
                     'error': 'INSUFFICIENT_PERMISSIONS',
                     'message': f'Bạn không có quyền truy cập endpoint này. Cần quyền: {", ".join(allowed_roles)}',
@@ -95,7 +209,7 @@ def role_required(*allowed_roles):
                         'endpoint': f.__name__,
                         'access_denied_reason': f'User có quyền "{current_user.user_type}" nhưng endpoint yêu cầu một trong các quyền: {", ".join(allowed_roles)}'
                     },
-                    'timestamp': datetime.utcnow().isoformat(),
+                    'timestamp': format_timestamp(),
                     'status_code': 403
                 }), 403
             
@@ -123,6 +237,9 @@ def blacklist_token(jti, expires_delta):
     """Add token to blacklist"""
     try:
         redis_client.setex(f"blacklist:{jti}", expires_delta, "true")
+        # Visible to this worker at once and to the others through the feed
+        _remember_revoked(jti, expires_delta)
+        redis_client.publish(_REVOCATION_CHANNEL, f"{jti}:{expires_delta}")
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to blacklist token: {str(e)}")
@@ -131,6 +248,6 @@ def blacklist_token(jti, expires_delta):
 def is_token_blacklisted(jti):
     """Check if token is blacklisted"""
     try:
-        return redis_client.get(f"blacklist:{jti}") is not None
+        return _is_revoked(jti)
     except Exception:
         return False
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+
+# gunicorn -c gunicorn.conf.py "app:create_app()"
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+# Keep threads <= DB_POOL_SIZE + DB_MAX_OVERFLOW so a worker never waits on the pool
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
@@ -0,0 +1,38 @@
+import decimal
+import time
+import orjson
+from flask.json.provider import JSONProvider
+
+def _default(obj):
+    """Fallback for types orjson does not serialize natively"""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+# Naive datetimes are UTC throughout the app; emit them with a 'Z' suffix
+_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+def format_timestamp(seconds=None):
+    """Envelope timestamp: UTC, whole seconds, 'Z' suffix (now if seconds is None)"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+def dumps_bytes(obj):
+    """Serialize obj to UTF-8 JSON bytes"""
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.get_json, ...)"""
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build the response body straight from orjson bytes (no str round trip)"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,34 @@
+"""Add composite indexes for hot enrollment/class filters
+
+Revision ID: 3f1c7a9e2b54
+Revises: 684a453ecbdb
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c7a9e2b54'
+down_revision = '684a453ecbdb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.create_index('ix_enrollment_student_status', ['StudentID', 'Status'], unique=False)
+        batch_op.create_index('ix_enrollment_class_status', ['ClassID', 'Status'], unique=False)
+
+    with op.batch_alter_table('classes', schema=None) as batch_op:
+        batch_op.create_index('ix_class_status_capacity', ['Status', 'CurrentEnrollment', 'MaxCapacity'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('classes', schema=None) as batch_op:
+        batch_op.drop_index('ix_class_status_capacity')
+
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.drop_index('ix_enrollment_class_status')
+        batch_op.drop_index('ix_enrollment_student_status')
@@ -0,0 +1,38 @@
+"""Add indexes for teacher schedule and user type filters
+
+Revision ID: b7e24d1c9f03
+Revises: 3f1c7a9e2b54
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e24d1c9f03'
+down_revision = '3f1c7a9e2b54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_type', ['UserType'], unique=False)
+
+    with op.batch_alter_table('classes', schema=None) as batch_op:
+        batch_op.create_index('ix_class_teacher_term', ['TeacherID', 'semester', 'AcademicYear'], unique=False)
+
+    with op.batch_alter_table('schedules', schema=None) as batch_op:
+        batch_op.create_index('ix_schedule_class_day', ['ClassID', 'DayOfWeek'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('schedules', schema=None) as batch_op:
+        batch_op.drop_index('ix_schedule_class_day')
+
+    with op.batch_alter_table('classes', schema=None) as batch_op:
+        batch_op.drop_index('ix_class_teacher_term')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_type')
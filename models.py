@@ -1,11 +1,50 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import os
 import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from enum import Enum
 from sqlalchemy import CheckConstraint, Enum as SqlEnum
 
 db = SQLAlchemy()
 
+# argon2/bcrypt release the GIL while hashing, so a thread pool lets several
+# hashes run in parallel instead of serialising on the request worker
+password_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+# argon2id for new hashes; bcrypt hashes ($2a$/$2b$) from before are still
+# accepted and upgraded on the next successful login
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def _is_bcrypt_hash(password_hash):
+    return password_hash.startswith('$2')
+
+def _hash_password(password):
+    return _password_hasher.hash(password)
+
+def _check_password(password, password_hash):
+    if _is_bcrypt_hash(password_hash):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    try:
+        return _password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+# Verified against when the username does not exist, so unknown and known
+# usernames take the same time to reject
+_DUMMY_PASSWORD_HASH = _hash_password('dummy-password')
+
+def verify_dummy_password(password):
+    """Spend the same hashing work as a real check; always False"""
+    password_executor.submit(_check_password, password, _DUMMY_PASSWORD_HASH).result()
+    return False
+
+def hash_passwords(passwords):
+    """Hash a batch of passwords in parallel (used by bulk imports)"""
+    return list(password_executor.map(_hash_password, passwords))
+
 class UserType(Enum):
     STUDENT = "Học sinh"
     TEACHER = "Giáo viên"
@@ -61,14 +100,23 @@ class User(db.Model):
     student = db.relationship('Student', backref='user', uselist=False, cascade='all, delete-orphan')
     teacher = db.relationship('Teacher', backref='user', uselist=False, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # user_type filter of the manager user listing
+        db.Index('ix_users_type', 'UserType'),
+    )
+    
     def set_password(self, password):
         """Hash and set password"""
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = password_executor.submit(_hash_password, password).result()
     
     def check_password(self, password):
-        """Check if provided password matches hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Check if provided password matches hash (re-hashing legacy/outdated hashes)"""
+        if not password_executor.submit(_check_password, password, self.password_hash).result():
+            return False
+        if _is_bcrypt_hash(self.password_hash) or _password_hasher.check_needs_rehash(self.password_hash):
+            # Persisted by the caller's next commit
+            self.set_password(password)
+        return True
     
     def update_last_login(self):
         """Update last login time"""
@@ -83,8 +131,8 @@ class User(db.Model):
             'email': self.email,
             'phone_number': self.phone_number,
             'user_type': self.user_type,
-            'date_created': self.date_created.isoformat() if self.date_created else None,
-            'last_login': self.last_login.isoformat() if self.last_login else None
+            'date_created': self.date_created,
+            'last_login': self.last_login
         }
 
 class Student(db.Model):
@@ -106,9 +154,9 @@ class Student(db.Model):
             'student_id': self.student_id,
             'user_id': self.user_id,
             'student_code': self.student_code,
-            'date_of_birth': self.date_of_birth.isoformat() if self.date_of_birth else None,
+            'date_of_birth': self.date_of_birth,
             'major': self.major,
-            'enrollment_date': self.enrollment_date.isoformat() if self.enrollment_date else None,
+            'enrollment_date': self.enrollment_date,
             'department_id': self.department_id
         }
 
@@ -129,7 +177,7 @@ class Teacher(db.Model):
             'teacher_id': self.teacher_id,
             'user_id': self.user_id,
             'teacher_code': self.teacher_code,
-            'hire_date': self.hire_date.isoformat() if self.hire_date else None,
+            'hire_date': self.hire_date,
             'department_id': self.department_id
         }
 
@@ -176,6 +224,13 @@ class Class(db.Model):
     schedules = db.relationship('Schedule', backref='class_ref', cascade='all, delete-orphan')
     enrollments = db.relationship('Enrollment', backref='class_ref', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Open-and-not-full filter of the available-classes listing
+        db.Index('ix_class_status_capacity', 'Status', 'CurrentEnrollment', 'MaxCapacity'),
+        # A teacher's classes in one term (schedule conflict check)
+        db.Index('ix_class_teacher_term', 'TeacherID', 'semester', 'AcademicYear'),
+    )
+    
     def to_dict(self):
         return {
             'class_id': self.class_id,
@@ -186,8 +241,8 @@ class Class(db.Model):
             'max_capacity': self.max_capacity,
             'current_enrollment': self.current_enrollment,
             'status': self.status,
-            'start_date': self.start_date.isoformat() if self.start_date else None,
-            'end_date': self.end_date.isoformat() if self.end_date else None
+            'start_date': self.start_date,
+            'end_date': self.end_date
         }
 
 class Schedule(db.Model):
@@ -200,6 +255,11 @@ class Schedule(db.Model):
     end_time = db.Column('EndTime', db.Time, nullable=False)
     room_location = db.Column('RoomLocation', db.String(50))
     
+    __table_args__ = (
+        # Per-class, per-day join of the schedule overlap check
+        db.Index('ix_schedule_class_day', 'ClassID', 'DayOfWeek'),
+    )
+    
     def to_dict(self):
         return {
             'schedule_id': self.schedule_id,
@@ -224,15 +284,18 @@ class Enrollment(db.Model):
 
     __table_args__ = (
             db.UniqueConstraint('StudentID', 'ClassID', name='unique_student_class'),
-            CheckConstraint('Score >= 0 AND Score <= 10', name='check_score_range')
+            CheckConstraint('Score >= 0 AND Score <= 10', name='check_score_range'),
+            # (student, status) and (class, status) lookups; (student, class) uses the unique index
+            db.Index('ix_enrollment_student_status', 'StudentID', 'Status'),
+            db.Index('ix_enrollment_class_status', 'ClassID', 'Status')
         )    
     def to_dict(self):
         return {
             'enrollment_id': self.enrollment_id,
             'student_id': self.student_id,
             'class_id': self.class_id,
-            'enrollment_date': self.enrollment_date.isoformat() if self.enrollment_date else None,
-            'cancellation_date': self.cancellation_date.isoformat() if self.cancellation_date else None,
+            'enrollment_date': self.enrollment_date,
+            'cancellation_date': self.cancellation_date,
             'grade': self.grade,
             'status': self.status,
             'score': self.score
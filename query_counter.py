@@ -0,0 +1,36 @@
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, raiseload
+from models import db
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._query_count = g.get('_query_count', 0) + 1
+
+def _raise_on_lazy_load(orm_execute_state):
+    # Top-level ORM selects only; relationship loads are what we want to surface
+    if orm_execute_state.is_select and not orm_execute_state.is_relationship_load:
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*'))
+
+def init_query_counter(app):
+    """Count SQL statements per request and flag endpoints over QUERY_BUDGET"""
+    budget = app.config.get('QUERY_BUDGET')
+    if budget is None:
+        return
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _count_query)
+
+    if app.config.get('SQLALCHEMY_RAISELOAD'):
+        event.listen(Session, 'do_orm_execute', _raise_on_lazy_load)
+
+    @app.after_request
+    def report_query_count(response):
+        count = g.get('_query_count', 0)
+        response.headers['X-Query-Count'] = str(count)
+        if count > budget:
+            current_app.logger.warning(
+                'Query budget exceeded: %s %s ran %d queries (budget %d)',
+                request.method, request.path, count, budget
+            )
+        return response
@@ -1,14 +1,64 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime
-from models import db, User, Student, Teacher, Department, UserType
-from decorators import token_required, blacklist_token
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, raiseload
+from models import db, User, Student, Teacher, UserType, verify_dummy_password
+from decorators import claims_required, blacklist_token
 
 # Import helpers từ file helpers.py
-from .helpers import error_response, success_response
+from .helpers import error_response, success_response, require_fields, get_department_cached, duplicate_key_field, parse_date, serialize_user
 
 auth_bp = Blueprint('auth', __name__)
 
+# Request-independent constants, built once at import time
+_USER_TYPES_LIST = tuple(e.value for e in UserType)
+_VALID_USER_TYPES = frozenset(_USER_TYPES_LIST)
+_REGISTER_REQUIRED = ('username', 'password', 'full_name', 'user_type')
+_USER_STUDENT = UserType.STUDENT.value
+_USER_TEACHER = UserType.TEACHER.value
+
+# Login point lookup: user and profile in one SELECT (departments come from
+# the department cache); any other relationship access raises instead of
+# silently issuing another query
+_LOGIN_USER_OPTIONS = (
+    joinedload(User.student),
+    joinedload(User.teacher),
+    raiseload('*')
+)
+
+def _department_claim(user):
+    """Department name for the JWT claims, loading only the profile matching user_type"""
+    if user.user_type == _USER_TEACHER:
+        profile = user.teacher
+    elif user.user_type == _USER_STUDENT:
+        profile = user.student
+    else:
+        return None
+    if not profile or not profile.department_id:
+        return None
+    department = get_department_cached(profile.department_id)
+    return department['department_name'] if department else None
+
+def _profile_payload(user):
+    """User data with the profile matching user_type and its cached department"""
+    student = user.student if user.user_type == _USER_STUDENT else None
+    teacher = user.teacher if user.user_type == _USER_TEACHER else None
+    profile = student or teacher
+    department_info = (get_department_cached(profile.department_id)
+                       if profile and profile.department_id else None)
+    return serialize_user(user, student=student, teacher=teacher, department_info=department_info)
+
+def _build_claims(user):
+    """Additional JWT claims shared by login and refresh"""
+    return {
+        'username': user.username,
+        'user_type': user.user_type,
+        'full_name': user.full_name,
+        'department': _department_claim(user),
+    }
+
 # ====================== AUTH ROUTES ======================
 
 @auth_bp.route('/register', methods=['POST'])
@@ -18,42 +68,36 @@ def register():
         data = request.get_json()
         
         # Required fields validation
-        required_fields = ['username', 'password', 'full_name', 'user_type']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'Thiếu các trường bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Check if username already exists
-        if User.query.filter_by(username=data['username']).first():
-            return error_response(
-                'USERNAME_EXISTS',
-                'Tên đăng nhập đã tồn tại.',
-                {'username': data['username'], 'suggestion': 'Please choose a different username'},
-                409
-            )
-        
-        # Check if email already exists (if provided)
-        if data.get('email') and User.query.filter_by(email=data['email']).first():
-            return error_response(
-                'EMAIL_EXISTS', 
-                'Email đã được sử dụng.',
-                {'email': data['email']},
-                409
-            )
+        invalid = require_fields(data, _REGISTER_REQUIRED)
+        if invalid is not None:
+            return invalid
         
         # Validate user type
-        valid_user_types = [e.value for e in UserType]
-        if data['user_type'] not in valid_user_types:
+        if data['user_type'] not in _VALID_USER_TYPES:
             return error_response(
                 'INVALID_USER_TYPE',
                 'Loại người dùng không hợp lệ.',
-                {'provided_type': data['user_type'], 'valid_types': valid_user_types}
+                {'provided_type': data['user_type'], 'valid_types': _USER_TYPES_LIST}
             )
         
+        # Validate department for student/teacher before anything is written
+        department_id = data.get('department_id')
+        if department_id and data['user_type'] in (_USER_STUDENT, _USER_TEACHER):
+            if not get_department_cached(department_id):
+                return error_response(
+                    'DEPARTMENT_NOT_FOUND',
+                    'Khoa không tồn tại.',
+                    {'department_id': department_id}
+                )
+        
+        # Validate dates
+        try:
+            date_of_birth = parse_date(data.get('date_of_birth'))
+            enrollment_date = parse_date(data.get('enrollment_date'))
+            hire_date = parse_date(data.get('hire_date'))
+        except ValueError:
+            return error_response('INVALID_DATE_FORMAT', 'Định dạng ngày không hợp lệ (YYYY-MM-DD).')
+        
         # Create new user
         user = User(
             username=data['username'],
@@ -64,54 +108,48 @@ def register():
         )
         user.set_password(data['password'])
         
-        db.session.add(user)
-        db.session.flush()  # Get user ID
-        
-        # Create specific user type record
-        if data['user_type'] == UserType.STUDENT.value:
-            # Validate department for student
-            department_id = data.get('department_id')
-            if department_id:
-                department = Department.query.get(department_id)
-                if not department:
-                    return error_response(
-                        'DEPARTMENT_NOT_FOUND',
-                        'Khoa không tồn tại.',
-                        {'department_id': department_id}
-                    )
-            
-            student = Student(
-                user_id=user.user_id,
+        # Create specific user type record through the relationship, so the
+        # profile row is inserted in the same flush as the user (no extra flush
+        # round trip just to learn the user ID)
+        if data['user_type'] == _USER_STUDENT:
+            user.student = Student(
                 student_code=data.get('student_code'),
-                date_of_birth=datetime.strptime(data['date_of_birth'], '%Y-%m-%d').date() if data.get('date_of_birth') else None,
+                date_of_birth=date_of_birth,
                 major=data.get('major'),
-                enrollment_date=datetime.strptime(data['enrollment_date'], '%Y-%m-%d').date() if data.get('enrollment_date') else None,
+                enrollment_date=enrollment_date,
                 department_id=department_id
             )
-            db.session.add(student)
             
-        elif data['user_type'] == UserType.TEACHER.value:
-            # Validate department for teacher
-            department_id = data.get('department_id')
-            if department_id:
-                department = Department.query.get(department_id)
-                if not department:
-                    return error_response(
-                        'DEPARTMENT_NOT_FOUND',
-                        'Khoa không tồn tại.',
-                        {'department_id': department_id}
-                    )
-            
-            teacher = Teacher(
-                user_id=user.user_id,
+        elif data['user_type'] == _USER_TEACHER:
+            user.teacher = Teacher(
                 teacher_code=data.get('teacher_code'),
-                department=data.get('department'),  # Keep for backward compatibility
-                hire_date=datetime.strptime(data['hire_date'], '%Y-%m-%d').date() if data.get('hire_date') else None,
+                hire_date=hire_date,
                 department_id=department_id
             )
-            db.session.add(teacher)
         
-        db.session.commit()
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            # Username/email uniqueness is enforced by the unique indexes
+            # instead of a SELECT before the insert
+            db.session.rollback()
+            duplicate = duplicate_key_field(e)
+            if duplicate == 'username':
+                return error_response(
+                    'USERNAME_EXISTS',
+                    'Tên đăng nhập đã tồn tại.',
+                    {'username': data['username'], 'suggestion': 'Please choose a different username'},
+                    409
+                )
+            if duplicate == 'email':
+                return error_response(
+                    'EMAIL_EXISTS', 
+                    'Email đã được sử dụng.',
+                    {'email': data['email']},
+                    409
+                )
+            raise
         
         return success_response(
             'Đăng ký tài khoản thành công.',
@@ -141,8 +179,12 @@ def login():
                 {'required_fields': ['username', 'password']}
             )
         
-        user = User.query.filter_by(username=data['username']).first()
+        user = db.session.scalar(
+            select(User).options(*_LOGIN_USER_OPTIONS).where(User.username == data['username'])
+        )
         
+        if not user:
+            verify_dummy_password(data['password'])
         if not user or not user.check_password(data['password']):
             return error_response(
                 'INVALID_CREDENTIALS',
@@ -151,43 +193,17 @@ def login():
                 401
             )
         
-        # Update last login
-        user.update_last_login()
-        
-        # Get department info for claims
-        department_name = None
-        if user.teacher and user.teacher.department_id:
-            department = Department.query.get(user.teacher.department_id)
-            department_name = department.department_name 
-        elif user.teacher:
-            department_name = user.teacher.department
+        # Update last login (committed once the response data is built, since
+        # the commit expires the eagerly loaded profile)
+        user.last_login = datetime.utcnow()
         
-        if user.student and user.student.department_id:
-            department = Department.query.get(user.student.department_id)
-            department_name = department.department_name 
- 
-        claims = {
-            'username': user.username,
-            'user_type': user.user_type,
-            'full_name': user.full_name,
-            'department': department_name,
-        }
-        
-        access_token = create_access_token(identity=str(user.user_id), additional_claims=claims)
+        access_token = create_access_token(identity=str(user.user_id), additional_claims=_build_claims(user))
         refresh_token = create_refresh_token(identity=str(user.user_id))
         
         # Get user-specific data
-        user_data = user.to_dict()
-        if user.user_type == UserType.STUDENT.value and user.student:
-            user_data['student_info'] = user.student.to_dict()
-            if user.student.department_id:
-                department = Department.query.get(user.student.department_id)
-                user_data['department_info'] = department.to_dict() if department else None
-        elif user.user_type == UserType.TEACHER.value and user.teacher:
-            user_data['teacher_info'] = user.teacher.to_dict()
-            if user.teacher.department_id:
-                department = Department.query.get(user.teacher.department_id)
-                user_data['department_info'] = department.to_dict() if department else None
+        user_data = _profile_payload(user)
+        
+        db.session.commit()
         
         return jsonify({
             'message': 'Login successful',
@@ -205,31 +221,15 @@ def refresh():
     """Refresh access token"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        # User and profile in one SELECT; the department name comes from the cache
+        user = db.session.get(User, int(current_user_id), options=_LOGIN_USER_OPTIONS)
         
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Get department info for claims
-        department_name = None
-        if user.teacher and user.teacher.department_id:
-            department = Department.query.get(user.teacher.department_id)
-            department_name = department.department_name if department else user.teacher.department
-        elif user.teacher:
-            department_name = user.teacher.department
-        if user.student and user.student.department_id:
-            department = Department.query.get(user.student.department_id)
-            department_name = department.department_name if department else user.student.department
-        elif user.student:
-            department_name = user.student.department
         new_access_token = create_access_token(
             identity=current_user_id,
-            additional_claims={
-                'username': user.username,
-                'user_type': user.user_type,
-                'full_name': user.full_name,
-                'department': department_name,
-            }
+            additional_claims=_build_claims(user)
         )
         
         return jsonify({
@@ -256,27 +256,43 @@ def logout():
         return jsonify({'message': 'Logout failed', 'error': str(e)}), 500
 
 @auth_bp.route('/profile', methods=['GET'])
-@token_required
-def get_profile(current_user):
-    """Get current user profile"""
+@claims_required
+def get_profile(claims):
+    """Get current user profile (from the token claims unless ?refresh=1)"""
     try:
-        user_data = current_user.to_dict()
+        if request.args.get('refresh') != '1':
+            # Everything the token already carries; no database access. The
+            # claims never change for a token, so its jti is a strong ETag
+            etag = claims['jti']
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            
+            response = jsonify({
+                'user': {
+                    'user_id': int(get_jwt_identity()),
+                    'username': claims.get('username'),
+                    'full_name': claims.get('full_name'),
+                    'user_type': claims.get('user_type'),
+                    'department': claims.get('department')
+                }
+            })
+            response.set_etag(etag)
+            return response
         
-        # Add specific info based on user type
-        if current_user.user_type == UserType.STUDENT.value and current_user.student:
-            user_data['student_info'] = current_user.student.to_dict()
-            if current_user.student.department_id:
-                department = Department.query.get(current_user.student.department_id)
-                user_data['department_info'] = department.to_dict() if department else None
-        elif current_user.user_type == UserType.TEACHER.value and current_user.teacher:
-            user_data['teacher_info'] = current_user.teacher.to_dict()
-            if current_user.teacher.department_id:
-                department = Department.query.get(current_user.teacher.department_id)
-                user_data['department_info'] = department.to_dict() if department else None
+        current_user = db.session.get(User, int(get_jwt_identity()))
+        if not current_user:
+            return error_response('USER_NOT_FOUND', 'Người dùng không tồn tại trong hệ thống.', status_code=404)
         
-        return jsonify({
+        user_data = _profile_payload(current_user)
+        
+        # Content-hash ETag: an unchanged profile is answered with an empty 304
+        response = jsonify({
             'user': user_data
-        }), 200
+        })
+        response.add_etag()
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'message': 'Failed to get profile', 'error': str(e)}), 500
\ No newline at end of file
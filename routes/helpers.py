@@ -1,117 +1,314 @@
-from datetime import datetime, timedelta
-from flask import jsonify, make_response
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache, wraps
+import math
+import re
+import threading
+import time
+from flask import Response, g, has_request_context, request, stream_with_context, url_for
+from json_provider import dumps_bytes, format_timestamp
 from models import (
     db, User, Student, Teacher, Course, Class, Schedule, Department,
     Enrollment, UserType, ClassStatus, EnrollmentStatus
 )
 # ====================== RESPONSE HELPERS ======================
+_JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+@lru_cache(maxsize=2)
+def _timestamp_fragment(second):
+    """'"timestamp":"<ISO-8601 UTC>"' JSON member for a whole epoch second (built once per second)"""
+    return b'"timestamp":"' + format_timestamp(second).encode() + b'"'
+
+# The error code/message (or success message) part of the envelope repeats
+# across calls, so it is encoded once per distinct pair and reused
+@lru_cache(maxsize=512)
+def _error_head(error_code, message):
+    return b'{"error":' + dumps_bytes(error_code) + b',"message":' + dumps_bytes(message) + b','
+
+@lru_cache(maxsize=512)
+def _success_head(message):
+    return b'{"success":true,"message":' + dumps_bytes(message) + b','
+
+def _envelope(head, status_code, key, payload):
+    """Assemble the fixed-shape response envelope; only the payload goes through orjson"""
+    body = head + _timestamp_fragment(int(time.time())) + b',"status_code":%d' % status_code
+    if payload:
+        body += key + dumps_bytes(payload)
+    return Response(body + b'}', status=status_code, content_type=_JSON_CONTENT_TYPE)
+
 # Helper function for error responses
 def error_response(error_code, message, details=None, status_code=400):
     """Standardized error response format"""
-    response_data = {
-        'error': error_code,
-        'message': message,
-        'timestamp': datetime.utcnow().isoformat(),
-        'status_code': status_code
-    }
-    if details:
-        response_data['details'] = details
-
-    response = make_response(jsonify(response_data), status_code)
-    response.headers["Content-Type"] = "application/json; charset=utf-8"
-    return response
+    return _envelope(_error_head(error_code, message), status_code, b',"details":', details)
 
 # Helper function for success responses
 def success_response(message, data=None, status_code=200):
     """Standardized success response format"""
-    response_data = {
-        'success': True,
-        'message': message,
-        'timestamp': datetime.utcnow().isoformat(),
-        'status_code': status_code
+    return _envelope(_success_head(message), status_code, b',"data":', data)
+
+# Helper for request body validation
+def require_fields(data, required_fields, message='Thiếu các trường bắt buộc.'):
+    """Error response for a non-object body or missing required fields (None if valid)"""
+    if not isinstance(data, dict):
+        return error_response('INVALID_JSON', 'Dữ liệu gửi lên phải là đối tượng JSON.')
+    missing_fields = [field for field in required_fields if not data.get(field)]
+    if missing_fields:
+        return error_response(
+            'MISSING_REQUIRED_FIELDS',
+            message,
+            {'missing_fields': missing_fields, 'required_fields': required_fields}
+        )
+    return None
+
+# Helper for keyset-paginated list endpoints
+def next_page_headers(next_after):
+    """Link header pointing at the next keyset page (empty on the last page)"""
+    if next_after is None:
+        return {}
+    args = request.args.to_dict()
+    args.pop('page', None)
+    args['after_id'] = next_after
+    return {'Link': f'<{url_for(request.endpoint, **args)}>; rel="next"'}
+
+# Helpers for offset-paginated list endpoints
+def get_page_args(default_per_page=50, max_per_page=200):
+    """Read page/per_page from the query string, clamped to sane bounds"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    if per_page < 1:
+        per_page = default_per_page
+    return page, min(per_page, max_per_page)
+
+def page_info(page, per_page, total):
+    """Pagination block for list responses"""
+    pages = math.ceil(total / per_page) if total else 0
+    return {
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'total': total,
+        'has_next': page < pages,
+        'has_prev': page > 1
     }
-    if data:
-        response_data['data'] = data
 
-    response = make_response(jsonify(response_data), status_code)
-    response.headers["Content-Type"] = "application/json; charset=utf-8"
-    return response
+# Helper for large list endpoints
+def stream_json_list(key, items, serialize, pagination, headers=None):
+    """Stream {key: [...], 'pagination': {...}} one serialized item at a time"""
+    def generate():
+        yield b'{"' + key.encode('utf-8') + b'":['
+        first = True
+        for item in items:
+            if not first:
+                yield b','
+            first = False
+            yield dumps_bytes(serialize(item))
+        yield b'],"pagination":' + dumps_bytes(pagination) + b'}'
+
+    return Response(stream_with_context(generate()), status=200,
+                    headers=headers, mimetype='application/json')
+
+def serialize_user(user, *, student=None, teacher=None, department_info=None):
+    """User payload (plus optional profile/department info) built as one dict"""
+    data = {
+        'user_id': user.user_id,
+        'username': user.username,
+        'full_name': user.full_name,
+        'email': user.email,
+        'phone_number': user.phone_number,
+        'user_type': user.user_type,
+        'date_created': user.date_created,
+        'last_login': user.last_login
+    }
+    if student is not None:
+        data['student_info'] = {
+            'student_id': student.student_id,
+            'user_id': student.user_id,
+            'student_code': student.student_code,
+            'date_of_birth': student.date_of_birth,
+            'major': student.major,
+            'enrollment_date': student.enrollment_date,
+            'department_id': student.department_id
+        }
+    elif teacher is not None:
+        data['teacher_info'] = {
+            'teacher_id': teacher.teacher_id,
+            'user_id': teacher.user_id,
+            'teacher_code': teacher.teacher_code,
+            'hire_date': teacher.hire_date,
+            'department_id': teacher.department_id
+        }
+    if department_info is not None:
+        data['department_info'] = department_info
+    return data
+
+# ====================== CACHED LOOKUPS ======================
+# Departments change rarely and the API has no department write routes; keep
+# their to_dict() per worker for a few minutes (edits made directly in the
+# database show up once the entry expires)
+_DEPARTMENT_CACHE_TTL = 300
+_DEPARTMENT_CACHE_MAX = 1024
+_department_cache = {}
+_department_cache_lock = threading.Lock()
+
+def get_department_cached(department_id):
+    """Department.to_dict() for an id (None if it does not exist), TTL-cached"""
+    now = time.monotonic()
+    entry = _department_cache.get(department_id)
+    if entry and entry[0] > now:
+        return entry[1]
+    
+    department = db.session.get(Department, department_id)
+    value = department.to_dict() if department else None
+    with _department_cache_lock:
+        if len(_department_cache) >= _DEPARTMENT_CACHE_MAX:
+            _department_cache.clear()
+        _department_cache[department_id] = (now + _DEPARTMENT_CACHE_TTL, value)
+    return value
+
+def ttl_cached(seconds):
+    """Keep a zero-argument function's result per worker for `seconds`.
+
+    The wrapped function gets an ``invalidate()`` attribute for writers; the
+    cached value is shared, so callers must not mutate it.
+    """
+    def decorator(func):
+        entry = [0.0, None]  # [expires_at, value]
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper():
+            if entry[0] > time.monotonic():
+                return entry[1]
+            with lock:
+                if entry[0] <= time.monotonic():
+                    entry[1] = func()
+                    entry[0] = time.monotonic() + seconds
+                return entry[1]
+
+        def invalidate():
+            entry[0] = 0.0
+
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
 
 # ====================== VALIDATION & UTILITY HELPERS ======================
+_USER_STUDENT = UserType.STUDENT.value
+_USER_TEACHER = UserType.TEACHER.value
+
+def _request_clock(attr, clock):
+    """clock() read once per request and kept on g (read directly outside a request)"""
+    if not has_request_context():
+        return clock()
+    value = g.get(attr)
+    if value is None:
+        value = clock()
+        setattr(g, attr, value)
+    return value
+
+def _utc_today():
+    return datetime.utcnow().date()
+
+# Unique-key violation: MySQL "Duplicate entry ... for key '[users.]Username'",
+# SQLite "UNIQUE constraint failed: users.Username"
+_DUPLICATE_KEY = re.compile(r"(?:for key '(?:\w+\.)?|UNIQUE constraint failed: \w+\.)(\w+)")
+_UNIQUE_COLUMNS = {'Username': 'username', 'Email': 'email', 'CourseCode': 'course_code'}
+
+def duplicate_key_field(error):
+    """'username', 'email' or 'course_code' if an IntegrityError hit that unique column, else None"""
+    match = _DUPLICATE_KEY.search(str(error.orig))
+    return _UNIQUE_COLUMNS.get(match.group(1)) if match else None
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD string into a date (None if empty)"""
+    return date.fromisoformat(value) if value else None
+
+def format_hhmm(value):
+    """Format a time as HH:MM (None if empty); cheaper than strftime"""
+    return f'{value.hour:02d}:{value.minute:02d}' if value else None
+
+# Lower bounds of each GPA band (ascending) and the label for each band
+_GPA_THRESHOLDS = (4.0, 5.5, 7.0, 8.5)
+_GPA_LABELS = ('Yếu', 'Trung bình', 'Khá', 'Giỏi', 'Xuất sắc')
+
 def get_gpa_classification(gpa):
     """Classify GPA into performance categories"""
-    if gpa >= 8.5:
-        return 'Xuất sắc'
-    elif gpa >= 7.0:
-        return 'Giỏi'
-    elif gpa >= 5.5:
-        return 'Khá'
-    elif gpa >= 4.0:
-        return 'Trung bình'
-    else:
-        return 'Yếu'
+    return _GPA_LABELS[bisect_right(_GPA_THRESHOLDS, gpa)]
 
 def calculate_system_health_score(unassigned_classes, students_without_dept, 
                                 teachers_without_dept, under_enrolled, 
                                 total_classes, total_students, total_teachers):
     """Calculate a system health score (0-100)"""
-    score = 100
-    
-    # Deduct points for issues
-    if total_classes > 0:
-        score -= (unassigned_classes / total_classes) * 20  # 20% weight for unassigned classes
-        score -= (under_enrolled / total_classes) * 15     # 15% weight for under-enrollment
+    # Reciprocals of the totals (0 for an empty total, so its ratios drop out)
+    per_class = 1 / total_classes if total_classes > 0 else 0
+    per_student = 1 / total_students if total_students > 0 else 0
+    per_teacher = 1 / total_teachers if total_teachers > 0 else 0
     
-    if total_students > 0:
-        score -= (students_without_dept / total_students) * 10  # 10% weight
-    
-    if total_teachers > 0:
-        score -= (teachers_without_dept / total_teachers) * 10  # 10% weight
+    # Deduct points for issues: 20% weight for unassigned classes, 15% for
+    # under-enrollment, 10% each for students/teachers without a department
+    score = (100
+             - (unassigned_classes * 20 + under_enrolled * 15) * per_class
+             - students_without_dept * 10 * per_student
+             - teachers_without_dept * 10 * per_teacher)
     
     return max(0, round(score, 1))
 
+# Shared validation results (the success and constant failures need no new tuple)
+_TIMING_OK = (True, None, None)
+_REGISTRATION_CLOSED = (False, 'REGISTRATION_CLOSED', 'Không thể đăng ký vì lớp học đã bắt đầu.')
+_CLASS_ENDED = (False, 'CLASS_ENDED', 'Lớp học đã kết thúc.')
+
+@lru_cache(maxsize=64)
+def _wrong_semester(semester, academic_year):
+    return False, 'WRONG_SEMESTER', f'Lớp học thuộc học kì {semester} năm học {academic_year}.'
+
 def validate_class_timing_constraints(class_obj, current_user_type, current_user):
     """Validate class timing and enrollment constraints"""
-    current_date = datetime.utcnow().date()
+    current_date = _request_clock('_utctoday', _utc_today)
+    
+    if current_user_type != _USER_STUDENT:
+        # Teachers (viewing their ongoing classes) and managers are only held
+        # to the class end date
+        if class_obj.end_date and class_obj.end_date < current_date:
+            return _CLASS_ENDED
+        return _TIMING_OK
     
-    # Check if class is within valid time frame for enrollment/teaching
+    # Students cannot enroll after class has started
     if class_obj.start_date and class_obj.start_date < current_date:
-        if current_user_type == UserType.STUDENT.value:
-            # Students cannot enroll after class has started
-            return False, 'REGISTRATION_CLOSED', 'Không thể đăng ký vì lớp học đã bắt đầu.'
-        elif current_user_type == UserType.TEACHER.value:
-            # Allow teachers to view their ongoing classes
-            pass
+        return _REGISTRATION_CLOSED
     
     # Check if class has ended
     if class_obj.end_date and class_obj.end_date < current_date:
-        return False, 'CLASS_ENDED', 'Lớp học đã kết thúc.'
-    
-    # Additional semester/academic year validation
-    current_semester = get_current_semester()  # You need to implement this
-    current_academic_year = get_current_academic_year()  # You need to implement this
+        return _CLASS_ENDED
     
-    if class_obj.semester != current_semester or class_obj.academic_year != current_academic_year:
-        if current_user_type == UserType.STUDENT.value:
-            return False, 'WRONG_SEMESTER', f'Lớp học thuộc học kì {class_obj.semester} năm học {class_obj.academic_year}.'
+    # Additional semester/academic year validation (the semester column loads
+    # as a SemesterEnum member; compare its value with the current label)
+    semester = getattr(class_obj.semester, 'value', class_obj.semester)
+    if semester != get_current_semester() or class_obj.academic_year != get_current_academic_year():
+        return _wrong_semester(semester, class_obj.academic_year)
     
-    return True, None, None
+    return _TIMING_OK
+
+_SEMESTER_1 = "Học kỳ 1"
+_SEMESTER_2 = "Học kỳ 2"
+_SEMESTER_SUMMER = "Học kỳ hè"
+
+# Semester for each month (index 0 unused): Jan-May HK2, Jun-Aug summer, Sep-Dec HK1
+_SEMESTER_BY_MONTH = (None,) + (_SEMESTER_2,) * 5 + (_SEMESTER_SUMMER,) * 3 + (_SEMESTER_1,) * 4
+
+@lru_cache(maxsize=4)
+def _academic_year_of(current_year, after_august):
+    if after_august:
+        return f"{current_year}-{current_year + 1}"
+    else:
+        return f"{current_year - 1}-{current_year}"
 
 def get_current_semester():
     """Get current semester based on current date"""
-    current_month = datetime.now().month
-    if 1 <= current_month <= 5:
-        return "Học kỳ 2"
-    elif 6 <= current_month <= 8:
-        return "Học kỳ hè"
-    else:
-        return "Học kỳ 1"
+    return _SEMESTER_BY_MONTH[_request_clock('_localnow', datetime.now).month]
 
 def get_current_academic_year():
     """Get current academic year"""
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-    if current_month >= 9:
-        return f"{current_year}-{current_year + 1}"
-    else:
-        return f"{current_year - 1}-{current_year}"
\ No newline at end of file
+    now = _request_clock('_localnow', datetime.now)
+    # Keyed on the calendar values, so the cached string is never stale
+    return _academic_year_of(now.year, now.month >= 9)
\ No newline at end of file
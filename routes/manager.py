@@ -1,19 +1,82 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 import re
+from bisect import bisect_right
+from collections import defaultdict
 
 from models import (
     db, Enrollment, Class, Course, Department,
-    UserType, ClassStatus, EnrollmentStatus,Schedule,Teacher, User,Student
+    UserType, ClassStatus, EnrollmentStatus,Schedule,Teacher, User,Student,
+    hash_passwords
 )
 from decorators import manager_required
-from sqlalchemy import func
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, contains_eager, joinedload
+import math
 
 # Import helpers
-from .helpers import error_response, success_response, get_current_semester, get_current_academic_year, calculate_system_health_score
+from .helpers import error_response, success_response, require_fields, next_page_headers, stream_json_list, serialize_user, duplicate_key_field, parse_date, format_hhmm, get_department_cached, ttl_cached, get_current_semester, get_current_academic_year, calculate_system_health_score
 
 manager_bp = Blueprint('manager', __name__)
 
+# Request-independent constants, built once at import time
+_CREATE_CLASS_REQUIRED = ('course_id', 'semester', 'academic_year', 'max_capacity', 'start_date', 'end_date')
+_ASSIGN_TEACHER_REQUIRED = ('class_id', 'teacher_id')
+_ADD_STUDENT_REQUIRED = ('username', 'password', 'full_name', 'email', 'phone_number', 'major', 'department_id')
+_ADD_TEACHER_REQUIRED = ('username', 'password', 'full_name', 'email', 'phone_number', 'department', 'department_id')
+_CREATE_COURSE_REQUIRED = ('course_code', 'course_name', 'credits', 'department_id')
+_UPDATE_GRADE_REQUIRED = ('enrollment_id', 'score')
+_VALID_SEMESTERS = ('Học kỳ 1', 'Học kỳ 2', 'Học kỳ hè')
+_ACADEMIC_YEAR_RE = re.compile(r'\d{4}-\d{4}')
+
+_CLASS_OPEN = ClassStatus.OPEN.value
+_CLASS_IN_PROGRESS = ClassStatus.IN_PROGRESS.value
+_CLASS_COMPLETED = ClassStatus.COMPLETED.value
+_ENROLLMENT_REGISTERED = EnrollmentStatus.REGISTERED.value
+_ENROLLMENT_COMPLETED = EnrollmentStatus.COMPLETED.value
+_ENROLLMENT_FAILED = EnrollmentStatus.FAILED.value
+_ENROLLMENT_GRADED_STATUSES = (_ENROLLMENT_COMPLETED, _ENROLLMENT_FAILED)
+_USER_STUDENT = UserType.STUDENT.value
+_USER_TEACHER = UserType.TEACHER.value
+
+# Score -> (grade, enrollment status), looked up like get_gpa_classification
+_SCORE_THRESHOLDS = (4.0, 5.5, 7.0, 8.5)
+_SCORE_GRADES = (
+    ('F', _ENROLLMENT_FAILED),
+    ('D', _ENROLLMENT_COMPLETED),
+    ('C', _ENROLLMENT_COMPLETED),
+    ('B', _ENROLLMENT_COMPLETED),
+    ('A', _ENROLLMENT_COMPLETED)
+)
+
+def _score_to_grade(score):
+    return _SCORE_GRADES[bisect_right(_SCORE_THRESHOLDS, score)]
+
+def _count_of(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+# All overview counters in one SELECT of scalar subqueries (one round trip)
+_OVERVIEW_COUNTS = select(
+    _count_of(Student).label('total_students'),
+    _count_of(Teacher).label('total_teachers'),
+    _count_of(Course).label('total_courses'),
+    _count_of(Class).label('total_classes'),
+    _count_of(Class, Class.status == _CLASS_OPEN).label('active_classes'),
+    _count_of(Enrollment, Enrollment.status == _ENROLLMENT_REGISTERED).label('total_enrollments'),
+    _count_of(Department).label('total_departments')
+)
+
+# Read-only dashboard data that tolerates seconds of staleness; kept per
+# worker and dropped by the routes that change it
+@ttl_cached(30)
+def _overview_counts():
+    return dict(db.session.execute(_OVERVIEW_COUNTS).one()._mapping)
+
+@ttl_cached(60)
+def _departments_list():
+    return [dept.to_dict() for dept in Department.query.all()]
+
 # ====================== MANAGER ROUTES ======================
 
 
@@ -22,25 +85,8 @@ manager_bp = Blueprint('manager', __name__)
 def get_system_overview(current_user):
     """Get system overview statistics"""
     try:
-        # Get statistics
-        total_students = Student.query.count()
-        total_teachers = Teacher.query.count()
-        total_courses = Course.query.count()
-        total_classes = Class.query.count()
-        active_classes = Class.query.filter_by(status=ClassStatus.OPEN.value).count()
-        total_enrollments = Enrollment.query.filter_by(status=EnrollmentStatus.REGISTERED.value).count()
-        total_departments = Department.query.count()
-        
         return jsonify({
-            'overview': {
-                'total_students': total_students,
-                'total_teachers': total_teachers,
-                'total_courses': total_courses,
-                'total_classes': total_classes,
-                'active_classes': active_classes,
-                'total_enrollments': total_enrollments,
-                'total_departments': total_departments
-            }
+            'overview': _overview_counts()
         }), 200
         
     except Exception as e:
@@ -51,8 +97,7 @@ def get_system_overview(current_user):
 def get_all_departments(current_user):
     """Get all departments"""
     try:
-        departments = Department.query.all()
-        departments_data = [dept.to_dict() for dept in departments]
+        departments_data = _departments_list()
         
         return jsonify({
             'departments': departments_data
@@ -68,24 +113,19 @@ def create_class(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['course_id', 'semester', 'academic_year', 'max_capacity', 'start_date', 'end_date']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'Thiếu các trường bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
+        invalid = require_fields(data, _CREATE_CLASS_REQUIRED)
+        if invalid is not None:
+            return invalid
         
         # Verify course exists
-        course = Course.query.get(data['course_id'])
+        course = db.session.get(Course, data['course_id'])
         if not course:
             return error_response('COURSE_NOT_FOUND', 'Khóa học không tồn tại.', status_code=404)
         
         # Validate dates
         try:
-            start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
-            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+            start_date = parse_date(data['start_date'])
+            end_date = parse_date(data['end_date'])
             if start_date >= end_date:
                 return error_response(
                     'INVALID_DATES',
@@ -110,18 +150,15 @@ def create_class(current_user):
             return error_response('INVALID_CAPACITY', 'Sức chứa tối đa phải lớn hơn 0.')
         
         # Validate semester format
-        valid_semesters = ['Học kỳ 1', 'Học kỳ 2', 'Học kỳ hè']
-        if data['semester'] not in valid_semesters:
+        if data['semester'] not in _VALID_SEMESTERS:
             return error_response(
                 'INVALID_SEMESTER',
                 'Học kỳ không hợp lệ.',
-                {'provided_semester': data['semester'], 'valid_semesters': valid_semesters}
+                {'provided_semester': data['semester'], 'valid_semesters': _VALID_SEMESTERS}
             )
         
         # Validate academic year format (YYYY-YYYY)
-        import re
-        academic_year_pattern = r'^\d{4}-\d{4}'
-        if not re.match(academic_year_pattern, data['academic_year']):
+        if not _ACADEMIC_YEAR_RE.fullmatch(data['academic_year']):
             return error_response(
                 'INVALID_ACADEMIC_YEAR',
                 'Năm học không hợp lệ. Định dạng: YYYY-YYYY',
@@ -152,57 +189,57 @@ def create_class(current_user):
             semester=data['semester'],
             academic_year=data['academic_year'],
             max_capacity=data['max_capacity'],
-            status=ClassStatus.OPEN.value,
+            status=_CLASS_OPEN,
             start_date=start_date,
             end_date=end_date,
             current_enrollment=0
         )
         
-        db.session.add(new_class)
-        db.session.flush()  # Get class ID
-        
-        # Add schedules if provided
-        if data.get('schedules'):
-            for schedule_data in data['schedules']:
-                try:
-                    schedule = Schedule(
-                        class_id=new_class.class_id,
-                        day_of_week=schedule_data['day_of_week'],
-                        start_time=datetime.strptime(schedule_data['start_time'], '%H:%M').time(),
-                        end_time=datetime.strptime(schedule_data['end_time'], '%H:%M').time(),
-                        room_location=schedule_data.get('room_location')
-                    )
-                    db.session.add(schedule)
-                except (KeyError, ValueError) as e:
-                    db.session.rollback()
-                    return error_response(
-                        'INVALID_SCHEDULE_DATA',
-                        'Dữ liệu lịch học không hợp lệ.',
-                        {'error': str(e)}
-                    )
+        # Attach schedules through the relationship so the class and its
+        # schedules are inserted in one flush at commit (no early flush just
+        # to learn the class ID)
+        for schedule_data in data.get('schedules') or ():
+            try:
+                new_class.schedules.append(Schedule(
+                    day_of_week=schedule_data['day_of_week'],
+                    start_time=datetime.strptime(schedule_data['start_time'], '%H:%M').time(),
+                    end_time=datetime.strptime(schedule_data['end_time'], '%H:%M').time(),
+                    room_location=schedule_data.get('room_location')
+                ))
+            except (KeyError, ValueError) as e:
+                return error_response(
+                    'INVALID_SCHEDULE_DATA',
+                    'Dữ liệu lịch học không hợp lệ.',
+                    {'error': str(e)}
+                )
         
-        db.session.commit()
+        db.session.add(new_class)
+        # Flush to get the generated IDs and build the response from the
+        # in-memory objects before the commit expires them (the commit then has
+        # nothing left to flush, so no reload or schedules SELECT is needed)
+        db.session.flush()
         
         class_data = new_class.to_dict()
         class_data['course_info'] = course.to_dict()
         
         # Add department info
         if course.department_id:
-            department = Department.query.get(course.department_id)
-            class_data['department_info'] = department.to_dict() if department else None
+            class_data['department_info'] = get_department_cached(course.department_id)
         
         # Add schedules info
-        schedules = Schedule.query.filter_by(class_id=new_class.class_id).all()
         class_data['schedules'] = [
             {
                 'schedule_id': s.schedule_id,
                 'day_of_week': s.day_of_week,
-                'start_time': s.start_time.strftime('%H:%M') if s.start_time else None,
-                'end_time': s.end_time.strftime('%H:%M') if s.end_time else None,
+                'start_time': format_hhmm(s.start_time),
+                'end_time': format_hhmm(s.end_time),
                 'room_location': s.room_location
-            } for s in schedules
+            } for s in new_class.schedules
         ]
         
+        db.session.commit()
+        _overview_counts.invalidate()
+        
         return success_response(
             'Tạo lớp học thành công.',
             {'class': class_data},
@@ -227,24 +264,37 @@ def assign_teacher(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['class_id', 'teacher_id']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'class_id và teacher_id là bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Verify class exists
-        class_obj = Class.query.get(data['class_id'])
-        if not class_obj:
-            return error_response('CLASS_NOT_FOUND', 'Lớp học không tồn tại.', status_code=404)
-        
-        # Verify teacher exists
-        teacher = Teacher.query.get(data['teacher_id'])
-        if not teacher:
+        invalid = require_fields(data, _ASSIGN_TEACHER_REQUIRED, 'class_id và teacher_id là bắt buộc.')
+        if invalid is not None:
+            return invalid
+        
+        # Fetch class, course, teacher, teacher's user and both department
+        # names in a single round trip
+        teacher_dept = aliased(Department)
+        course_dept = aliased(Department)
+        row = db.session.execute(
+            select(
+                Class, Teacher,
+                Course.course_name,
+                Course.department_id.label('course_department_id'),
+                User.full_name.label('teacher_name'),
+                teacher_dept.department_name.label('teacher_department_name'),
+                course_dept.department_name.label('course_department_name')
+            ).select_from(Class)
+            .join(Course, Course.course_id == Class.course_id)
+            .join(Teacher, Teacher.teacher_id == data['teacher_id'])
+            .join(User, User.user_id == Teacher.user_id)
+            .outerjoin(teacher_dept, teacher_dept.department_id == Teacher.department_id)
+            .outerjoin(course_dept, course_dept.department_id == Course.department_id)
+            .where(Class.class_id == data['class_id'])
+        ).first()
+        if not row:
+            # Only on the error path: find out which of the two is missing
+            if not db.session.get(Class, data['class_id']):
+                return error_response('CLASS_NOT_FOUND', 'Lớp học không tồn tại.', status_code=404)
             return error_response('TEACHER_NOT_FOUND', 'Giáo viên không tồn tại.', status_code=404)
+        (class_obj, teacher, course_name, course_department_id, teacher_name,
+         teacher_department_name, course_department_name) = row
         
         # CRITICAL: Check department match
         if not teacher.department_id:
@@ -253,72 +303,74 @@ def assign_teacher(current_user):
                 'Giáo viên chưa được phân công khoa. Vui lòng cập nhật thông tin giáo viên.'
             )
         
-        if not class_obj.course.department_id:
+        if not course_department_id:
             return error_response(
                 'COURSE_NO_DEPARTMENT',
                 'Khóa học chưa được phân công khoa.'
             )
         
-        if teacher.department_id != class_obj.course.department_id:
-            teacher_dept = Department.query.get(teacher.department_id)
-            course_dept = Department.query.get(class_obj.course.department_id)
+        if teacher.department_id != course_department_id:
             return error_response(
                 'DEPARTMENT_MISMATCH',
                 'Giáo viên chỉ có thể dạy các lớp học thuộc khoa của mình.',
                 {
-                    'teacher_department': teacher_dept.department_name if teacher_dept else 'Không xác định',
-                    'course_department': course_dept.department_name if course_dept else 'Không xác định',
+                    'teacher_department': teacher_department_name or 'Không xác định',
+                    'course_department': course_department_name or 'Không xác định',
                     'teacher_department_id': teacher.department_id,
-                    'course_department_id': class_obj.course.department_id
+                    'course_department_id': course_department_id
                 }
             )
         
-        # Check if teacher is already assigned to another class at the same time
-        conflicting_classes = Class.query.join(Schedule).filter(
-            Class.teacher_id == teacher.teacher_id,
-            Class.semester == class_obj.semester,
-            Class.academic_year == class_obj.academic_year,
-            Class.class_id != class_obj.class_id
-        ).all()
-        
-        # Get schedules for the class being assigned
-        new_schedules = Schedule.query.filter_by(class_id=class_obj.class_id).all()
+        # Check if teacher is already assigned to another class at the same
+        # time: one self-join of the teacher's schedules in the same term
+        # against the new class's schedules, overlap tested in SQL
+        new_schedule = aliased(Schedule)
+        conflict = db.session.execute(
+            select(
+                Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+                Class.class_id, Course.course_name
+            ).select_from(Schedule)
+            .join(Class, Class.class_id == Schedule.class_id)
+            .join(Course, Course.course_id == Class.course_id)
+            .join(new_schedule, new_schedule.day_of_week == Schedule.day_of_week)
+            .where(
+                Class.teacher_id == teacher.teacher_id,
+                Class.semester == class_obj.semester,
+                Class.academic_year == class_obj.academic_year,
+                Class.class_id != class_obj.class_id,
+                new_schedule.class_id == class_obj.class_id,
+                new_schedule.start_time < Schedule.end_time,
+                new_schedule.end_time > Schedule.start_time
+            ).limit(1)
+        ).first()
+        if conflict:
+            return error_response(
+                'SCHEDULE_CONFLICT',
+                f'Giáo viên đã có lịch dạy trùng vào {conflict.day_of_week} từ {conflict.start_time} đến {conflict.end_time}.',
+                {
+                    'conflicting_class_id': conflict.class_id,
+                    'conflicting_course': conflict.course_name
+                }
+            )
         
-        for conflict_class in conflicting_classes:
-            conflict_schedules = Schedule.query.filter_by(class_id=conflict_class.class_id).all()
-            
-            # Check for time conflicts
-            for new_schedule in new_schedules:
-                for conflict_schedule in conflict_schedules:
-                    if (new_schedule.day_of_week == conflict_schedule.day_of_week and
-                        new_schedule.start_time < conflict_schedule.end_time and
-                        new_schedule.end_time > conflict_schedule.start_time):
-                        return error_response(
-                            'SCHEDULE_CONFLICT',
-                            f'Giáo viên đã có lịch dạy trùng vào {new_schedule.day_of_week} từ {conflict_schedule.start_time} đến {conflict_schedule.end_time}.',
-                            {
-                                'conflicting_class_id': conflict_class.class_id,
-                                'conflicting_course': conflict_class.course.course_name
-                            }
-                        )
+        # Build the response before the commit expires class_obj and teacher
+        # (reading them afterwards would refresh each with its own SELECT)
+        assignment = {
+            'class_id': class_obj.class_id,
+            'course_name': course_name,
+            'teacher_info': {
+                'teacher_id': teacher.teacher_id,
+                'teacher_name': teacher_name,
+                'teacher_code': teacher.teacher_code,
+                'department': teacher_department_name
+            }
+        }
         
         # Assign teacher to class
         class_obj.teacher_id = data['teacher_id']
         db.session.commit()
         
-        return success_response(
-            'Phân công giáo viên thành công.',
-            {
-                'class_id': class_obj.class_id,
-                'course_name': class_obj.course.course_name,
-                'teacher_info': {
-                    'teacher_id': teacher.teacher_id,
-                    'teacher_name': teacher.user.full_name,
-                    'teacher_code': teacher.teacher_code,
-                    'department': teacher_dept.department_name if teacher_dept else None
-                }
-            }
-        )
+        return success_response('Phân công giáo viên thành công.', assignment)
         
     except Exception as e:
         db.session.rollback()
@@ -329,6 +381,74 @@ def assign_teacher(current_user):
             500
         )
 
+def _duplicate_user_response(error, data):
+    """409 for a username/email the unique indexes rejected (None for other violations)"""
+    duplicate = duplicate_key_field(error)
+    if duplicate == 'username':
+        return error_response(
+            'USERNAME_EXISTS',
+            'Tên đăng nhập đã tồn tại.',
+            {'username': data['username']},
+            409
+        )
+    if duplicate == 'email':
+        return error_response(
+            'EMAIL_EXISTS',
+            'Email đã được sử dụng.',
+            {'email': data['email']},
+            409
+        )
+    return None
+
+def _insert_user_rows(rows, user_type):
+    """Bulk-insert User rows for validated request dicts; fills in user_id"""
+    now = datetime.utcnow()
+    password_hashes = hash_passwords([row['password'] for row in rows])
+    user_rows = [
+        {
+            'username': row['username'],
+            'password_hash': password_hash,
+            'full_name': row['full_name'],
+            'email': row['email'],
+            'phone_number': row['phone_number'],
+            'user_type': user_type,
+            'date_created': now
+        } for row, password_hash in zip(rows, password_hashes)
+    ]
+    # return_defaults populates the generated user_id on each mapping
+    db.session.bulk_insert_mappings(User, user_rows, return_defaults=True)
+    return user_rows
+
+def _insert_students(rows):
+    """Bulk-insert users + student profiles (caller commits)"""
+    user_rows = _insert_user_rows(rows, _USER_STUDENT)
+    student_rows = [
+        {
+            'user_id': user_row['user_id'],
+            'major': row['major'],
+            'department_id': row['department_id'],
+            'student_code': row.get('student_code'),
+            'date_of_birth': row.get('date_of_birth'),
+            'enrollment_date': row.get('enrollment_date')
+        } for row, user_row in zip(rows, user_rows)
+    ]
+    db.session.bulk_insert_mappings(Student, student_rows, return_defaults=True)
+    return list(zip(user_rows, student_rows))
+
+def _insert_teachers(rows):
+    """Bulk-insert users + teacher profiles (caller commits)"""
+    user_rows = _insert_user_rows(rows, _USER_TEACHER)
+    teacher_rows = [
+        {
+            'user_id': user_row['user_id'],
+            'department_id': row['department_id'],
+            'teacher_code': row.get('teacher_code'),
+            'hire_date': row.get('hire_date')
+        } for row, user_row in zip(rows, user_rows)
+    ]
+    db.session.bulk_insert_mappings(Teacher, teacher_rows, return_defaults=True)
+    return list(zip(user_rows, teacher_rows))
+
 @manager_bp.route('/add-student', methods=['POST'])
 @manager_required
 def add_student(current_user):
@@ -336,35 +456,12 @@ def add_student(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['username', 'password', 'full_name', 'email', 'phone_number', 'major', 'department_id']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'Thiếu các trường bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Check if username exists
-        if User.query.filter_by(username=data['username']).first():
-            return error_response(
-                'USERNAME_EXISTS',
-                'Tên đăng nhập đã tồn tại.',
-                {'username': data['username']},
-                409
-            )
-        
-        # Check if email exists
-        if User.query.filter_by(email=data['email']).first():
-            return error_response(
-                'EMAIL_EXISTS',
-                'Email đã được sử dụng.',
-                {'email': data['email']},
-                409
-            )
+        invalid = require_fields(data, _ADD_STUDENT_REQUIRED)
+        if invalid is not None:
+            return invalid
         
         # Verify department exists
-        department = Department.query.get(data['department_id'])
+        department = db.session.get(Department, data['department_id'])
         if not department:
             return error_response(
                 'DEPARTMENT_NOT_FOUND',
@@ -373,33 +470,30 @@ def add_student(current_user):
                 404
             )
         
-        # Create user
-        user = User(
-            username=data['username'],
-            full_name=data['full_name'],
-            email=data['email'],
-            phone_number=data['phone_number'],
-            user_type=UserType.STUDENT.value
-        )
-        user.set_password(data['password'])
-        db.session.add(user)
-        db.session.flush()
-        
-        # Create student
-        student = Student(
-            user_id=user.user_id,
-            major=data['major'],
-            department_id=data['department_id'],
-            student_code=data.get('student_code'),
-            date_of_birth=datetime.strptime(data['date_of_birth'], '%Y-%m-%d').date() if data.get('date_of_birth') else None,
-            enrollment_date=datetime.strptime(data['enrollment_date'], '%Y-%m-%d').date() if data.get('enrollment_date') else None
-        )
-        db.session.add(student)
-        db.session.commit()
+        # Validate dates
+        try:
+            date_of_birth = parse_date(data.get('date_of_birth'))
+            enrollment_date = parse_date(data.get('enrollment_date'))
+        except ValueError:
+            return error_response('INVALID_DATE_FORMAT', 'Định dạng ngày không hợp lệ (YYYY-MM-DD).')
         
-        user_data = user.to_dict()
-        user_data['student_info'] = student.to_dict()
-        user_data['department_info'] = department.to_dict()
+        # Create user + student
+        try:
+            user_row, student_row = _insert_students([
+                dict(data, date_of_birth=date_of_birth, enrollment_date=enrollment_date)
+            ])[0]
+            db.session.commit()
+            _overview_counts.invalidate()
+        except IntegrityError as e:
+            db.session.rollback()
+            conflict = _duplicate_user_response(e, data)
+            if conflict is None:
+                raise
+            return conflict
+        
+        # Transient instances, only used for attribute access in serialize_user
+        user_data = serialize_user(User(**user_row), student=Student(**student_row),
+                                   department_info=department.to_dict())
         
         return success_response(
             'Thêm sinh viên thành công.',
@@ -423,35 +517,12 @@ def add_teacher(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['username', 'password', 'full_name', 'email', 'phone_number', 'department', 'department_id']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'Thiếu các trường bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Check if username exists
-        if User.query.filter_by(username=data['username']).first():
-            return error_response(
-                'USERNAME_EXISTS',
-                'Tên đăng nhập đã tồn tại.',
-                {'username': data['username']},
-                409
-            )
-        
-        # Check if email exists
-        if User.query.filter_by(email=data['email']).first():
-            return error_response(
-                'EMAIL_EXISTS',
-                'Email đã được sử dụng.',
-                {'email': data['email']},
-                409
-            )
+        invalid = require_fields(data, _ADD_TEACHER_REQUIRED)
+        if invalid is not None:
+            return invalid
         
         # Verify department exists
-        department = Department.query.get(data['department_id'])
+        department = db.session.get(Department, data['department_id'])
         if not department:
             return error_response(
                 'DEPARTMENT_NOT_FOUND',
@@ -460,32 +531,27 @@ def add_teacher(current_user):
                 404
             )
         
-        # Create user
-        user = User(
-            username=data['username'],
-            full_name=data['full_name'],
-            email=data['email'],
-            phone_number=data['phone_number'],
-            user_type=UserType.TEACHER.value
-        )
-        user.set_password(data['password'])
-        db.session.add(user)
-        db.session.flush()
-        
-        # Create teacher
-        teacher = Teacher(
-            user_id=user.user_id,
-            department=data['department'],
-            department_id=data['department_id'],
-            teacher_code=data.get('teacher_code'),
-            hire_date=datetime.strptime(data['hire_date'], '%Y-%m-%d').date() if data.get('hire_date') else None
-        )
-        db.session.add(teacher)
-        db.session.commit()
+        # Validate dates
+        try:
+            hire_date = parse_date(data.get('hire_date'))
+        except ValueError:
+            return error_response('INVALID_DATE_FORMAT', 'Định dạng ngày không hợp lệ (YYYY-MM-DD).')
         
-        user_data = user.to_dict()
-        user_data['teacher_info'] = teacher.to_dict()
-        user_data['department_info'] = department.to_dict()
+        # Create user + teacher
+        try:
+            user_row, teacher_row = _insert_teachers([dict(data, hire_date=hire_date)])[0]
+            db.session.commit()
+            _overview_counts.invalidate()
+        except IntegrityError as e:
+            db.session.rollback()
+            conflict = _duplicate_user_response(e, data)
+            if conflict is None:
+                raise
+            return conflict
+        
+        # Transient instances, only used for attribute access in serialize_user
+        user_data = serialize_user(User(**user_row), teacher=Teacher(**teacher_row),
+                                   department_info=department.to_dict())
         
         return success_response(
             'Thêm giáo viên thành công.',
@@ -507,67 +573,140 @@ def add_teacher(current_user):
 def get_all_users(current_user):
     """Get all users in the system"""
     try:
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 20, type=int)
+        if per_page < 1:
+            per_page = 20
+        after_id = request.args.get('after_id', type=int)
         user_type = request.args.get('user_type')
         department_id = request.args.get('department_id', type=int)
         
-        query = User.query
+        # Select plain columns instead of hydrating User/Student/Teacher objects
+        student_dept = aliased(Department)
+        teacher_dept = aliased(Department)
+        query = select(
+            User.user_id, User.username, User.full_name, User.email,
+            User.phone_number, User.user_type, User.date_created, User.last_login,
+            Student.student_id, Student.student_code, Student.date_of_birth,
+            Student.major, Student.enrollment_date,
+            Student.department_id.label('student_department_id'),
+            student_dept.department_name.label('student_department_name'),
+            Teacher.teacher_id, Teacher.teacher_code, Teacher.hire_date,
+            Teacher.department_id.label('teacher_department_id'),
+            teacher_dept.department_name.label('teacher_department_name')
+        ).select_from(User)\
+        .outerjoin(Student, Student.user_id == User.user_id)\
+        .outerjoin(student_dept, student_dept.department_id == Student.department_id)\
+        .outerjoin(Teacher, Teacher.user_id == User.user_id)\
+        .outerjoin(teacher_dept, teacher_dept.department_id == Teacher.department_id)
         
         if user_type:
-            query = query.filter_by(user_type=user_type)
+            query = query.where(User.user_type == user_type)
         
         # Filter by department if specified
         if department_id:
-            if user_type == UserType.STUDENT.value:
-                query = query.join(Student).filter(Student.department_id == department_id)
-            elif user_type == UserType.TEACHER.value:
-                query = query.join(Teacher).filter(Teacher.department_id == department_id)
-        
-        users = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
-        
-        users_data = []
-        for user in users.items:
-            user_data = user.to_dict()
-            
-            # Add specific info based on user type
-            if user.user_type == UserType.STUDENT.value and user.student:
-                user_data['student_info'] = user.student.to_dict()
-                if user.student.department_id:
-                    department = Department.query.get(user.student.department_id)
-                    user_data['department_info'] = department.to_dict() if department else None
-            elif user.user_type == UserType.TEACHER.value and user.teacher:
-                user_data['teacher_info'] = user.teacher.to_dict()
-                if user.teacher.department_id:
-                    department = Department.query.get(user.teacher.department_id)
-                    user_data['department_info'] = department.to_dict() if department else None
-            
-            users_data.append(user_data)
-        
-        return jsonify({
-            'users': users_data,
-            'pagination': {
-                'page': users.page,
-                'pages': users.pages,
-                'per_page': users.per_page,
-                'total': users.total,
-                'has_next': users.has_next,
-                'has_prev': users.has_prev
+            if user_type == _USER_STUDENT:
+                query = query.where(Student.department_id == department_id)
+            elif user_type == _USER_TEACHER:
+                query = query.where(Teacher.department_id == department_id)
+        
+        total = db.session.scalar(select(func.count()).select_from(query.subquery()))
+        query = query.order_by(User.user_id)
+        
+        if after_id is not None:
+            # Keyset pagination: seek past the last seen id instead of OFFSET.
+            # Probe the id index for the page boundary so the Link header is
+            # known before the body starts streaming
+            query = query.where(User.user_id > after_id)
+            boundary = db.session.scalars(
+                query.with_only_columns(User.user_id).offset(per_page - 1).limit(2)
+            ).all()
+            has_next = len(boundary) == 2
+            next_after = boundary[0] if has_next else None
+            pagination = {
+                'after_id': after_id,
+                'next_after': next_after,
+                'per_page': per_page,
+                'total': total,
+                'has_next': has_next
             }
-        }), 200
+            query = query.limit(per_page)
+        else:
+            pages = math.ceil(total / per_page) if total else 0
+            next_after = None
+            pagination = {
+                'page': page,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+            query = query.limit(per_page).offset((page - 1) * per_page)
+        
+        # Fetch in server-side batches and write each user straight to the wire
+        rows = db.session.execute(query.execution_options(yield_per=100)).mappings()
+        return stream_json_list('users', rows, _user_row_to_dict, pagination,
+                                headers=next_page_headers(next_after))
         
     except Exception as e:
         return jsonify({'message': 'Failed to get users', 'error': str(e)}), 500
 
+def _user_row_to_dict(row):
+    """Build the /all-users payload for one row of the flat user select"""
+    user_data = {
+        'user_id': row['user_id'],
+        'username': row['username'],
+        'full_name': row['full_name'],
+        'email': row['email'],
+        'phone_number': row['phone_number'],
+        'user_type': row['user_type'],
+        'date_created': row['date_created'],
+        'last_login': row['last_login']
+    }
+    
+    # Add specific info based on user type
+    if row['user_type'] == _USER_STUDENT and row['student_id'] is not None:
+        user_data['student_info'] = {
+            'student_id': row['student_id'],
+            'user_id': row['user_id'],
+            'student_code': row['student_code'],
+            'date_of_birth': row['date_of_birth'],
+            'major': row['major'],
+            'enrollment_date': row['enrollment_date'],
+            'department_id': row['student_department_id']
+        }
+        if row['student_department_id']:
+            user_data['department_info'] = {
+                'department_id': row['student_department_id'],
+                'department_name': row['student_department_name']
+            } if row['student_department_name'] is not None else None
+    elif row['user_type'] == _USER_TEACHER and row['teacher_id'] is not None:
+        user_data['teacher_info'] = {
+            'teacher_id': row['teacher_id'],
+            'user_id': row['user_id'],
+            'teacher_code': row['teacher_code'],
+            'hire_date': row['hire_date'],
+            'department_id': row['teacher_department_id']
+        }
+        if row['teacher_department_id']:
+            user_data['department_info'] = {
+                'department_id': row['teacher_department_id'],
+                'department_name': row['teacher_department_name']
+            } if row['teacher_department_name'] is not None else None
+    
+    return user_data
+
 @manager_bp.route('/all-classes', methods=['GET'])
 @manager_required
 def get_all_classes(current_user):
     """Get all classes in the system"""
     try:
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 20, type=int)
+        if per_page < 1:
+            per_page = 20
+        after_id = request.args.get('after_id', type=int)
         department_id = request.args.get('department_id', type=int)
         
         query = Class.query.join(Course)
@@ -576,43 +715,79 @@ def get_all_classes(current_user):
         if department_id:
             query = query.filter(Course.department_id == department_id)
         
-        classes = query.paginate(
-            page=page, per_page=per_page, error_out=False
+        total = query.count()
+        query = query.order_by(Class.class_id)
+        
+        if after_id is not None:
+            # Keyset pagination: seek past the last seen id instead of OFFSET
+            query = query.filter(Class.class_id > after_id)
+            boundary = [class_id for class_id, in query.with_entities(Class.class_id)
+                        .offset(per_page - 1).limit(2)]
+            has_next = len(boundary) == 2
+            next_after = boundary[0] if has_next else None
+            pagination = {
+                'after_id': after_id,
+                'next_after': next_after,
+                'per_page': per_page,
+                'total': total,
+                'has_next': has_next
+            }
+            query = query.limit(per_page)
+        else:
+            pages = math.ceil(total / per_page) if total else 0
+            next_after = None
+            pagination = {
+                'page': page,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+            query = query.limit(per_page).offset((page - 1) * per_page)
+        
+        # Course (already joined), department, teacher and teacher's user come
+        # with each class row instead of lazy loads per class. No raiseload:
+        # the rows are serialized while streaming, where an exception could only
+        # truncate the 200 response
+        query = query.options(
+            contains_eager(Class.course).joinedload(Course.department),
+            joinedload(Class.teacher).joinedload(Teacher.user),
+            joinedload(Class.teacher).joinedload(Teacher.department)
         )
         
-        classes_data = []
-        for class_obj in classes.items:
-            class_data = class_obj.to_dict()
-            class_data['course_info'] = class_obj.course.to_dict()
-            
-            # Add department info
-            if class_obj.course.department_id:
-                department = Department.query.get(class_obj.course.department_id)
-                class_data['department_info'] = department.to_dict() if department else None
-            
-            if class_obj.teacher:
-                class_data['teacher_info'] = {
-                    'teacher_name': class_obj.teacher.user.full_name,
-                    'department': class_obj.teacher.department
-                }
-            
-            classes_data.append(class_data)
-        
-        return jsonify({
-            'classes': classes_data,
-            'pagination': {
-                'page': classes.page,
-                'pages': classes.pages,
-                'per_page': classes.per_page,  
-                'total': classes.total,
-                'has_next': classes.has_next,
-                'has_prev': classes.has_prev
-            }
-        }), 200
+        # Run the query here so a database error still gets the error response
+        # below; only serialization is streamed
+        classes = query.all()
+        return stream_json_list('classes', classes, _class_to_dict,
+                                pagination, headers=next_page_headers(next_after))
         
     except Exception as e:
         return jsonify({'message': 'Failed to get classes', 'error': str(e)}), 500
 
+def _class_to_dict(class_obj):
+    """Build the /all-classes payload for one class
+
+    Expects course, course.department, teacher, teacher.user and
+    teacher.department to be preloaded (see get_all_classes).
+    """
+    class_data = class_obj.to_dict()
+    class_data['course_info'] = class_obj.course.to_dict()
+    
+    # Add department info
+    if class_obj.course.department_id:
+        department = class_obj.course.department
+        class_data['department_info'] = department.to_dict() if department else None
+    
+    teacher = class_obj.teacher
+    if teacher:
+        class_data['teacher_info'] = {
+            'teacher_name': teacher.user.full_name,
+            'department': teacher.department.department_name if teacher.department else None
+        }
+    
+    return class_data
+
 @manager_bp.route('/create-course', methods=['POST'])
 @manager_required
 def create_course(current_user):
@@ -620,26 +795,12 @@ def create_course(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['course_code', 'course_name', 'credits', 'department_id']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'Thiếu các trường bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Check if course code exists
-        if Course.query.filter_by(course_code=data['course_code']).first():
-            return error_response(
-                'COURSE_CODE_EXISTS',
-                'Mã khóa học đã tồn tại.',
-                {'course_code': data['course_code']},
-                409
-            )
+        invalid = require_fields(data, _CREATE_COURSE_REQUIRED)
+        if invalid is not None:
+            return invalid
         
         # Verify department exists
-        department = Department.query.get(data['department_id'])
+        department = get_department_cached(data['department_id'])
         if not department:
             return error_response(
                 'DEPARTMENT_NOT_FOUND',
@@ -648,7 +809,8 @@ def create_course(current_user):
                 404
             )
         
-        # Create course
+        # Create course; course_code uniqueness is enforced by its unique
+        # index instead of a SELECT before the insert
         course = Course(
             course_code=data['course_code'],
             course_name=data['course_name'],
@@ -657,11 +819,25 @@ def create_course(current_user):
             department_id=data['department_id']
         )
         
-        db.session.add(course)
-        db.session.commit()
-        
-        course_data = course.to_dict()
-        course_data['department_info'] = department.to_dict()
+        try:
+            db.session.add(course)
+            # Flush for the ID and build the response before the commit
+            # expires the object
+            db.session.flush()
+            course_data = course.to_dict()
+            course_data['department_info'] = department
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if duplicate_key_field(e) != 'course_code':
+                raise
+            return error_response(
+                'COURSE_CODE_EXISTS',
+                'Mã khóa học đã tồn tại.',
+                {'course_code': data['course_code']},
+                409
+            )
+        _overview_counts.invalidate()
         
         return success_response(
             'Tạo khóa học thành công.',
@@ -685,23 +861,25 @@ def update_student_grade(current_user):
     try:
         data = request.get_json()
         
-        required_fields = ['enrollment_id', 'score']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return error_response(
-                'MISSING_REQUIRED_FIELDS',
-                'enrollment_id và score là bắt buộc.',
-                {'missing_fields': missing_fields, 'required_fields': required_fields}
-            )
-        
-        # Find enrollment
-        enrollment = Enrollment.query.get(data['enrollment_id'])
+        invalid = require_fields(data, _UPDATE_GRADE_REQUIRED, 'enrollment_id và score là bắt buộc.')
+        if invalid is not None:
+            return invalid
+        
+        # Find enrollment together with the names echoed back in the response
+        enrollment = db.session.execute(
+            select(Enrollment.enrollment_id, User.full_name, Course.course_name)
+            .join(Student, Enrollment.student_id == Student.student_id)
+            .join(User, Student.user_id == User.user_id)
+            .join(Class, Enrollment.class_id == Class.class_id)
+            .join(Course, Class.course_id == Course.course_id)
+            .where(Enrollment.enrollment_id == data['enrollment_id'])
+        ).first()
         if not enrollment:
             return error_response('ENROLLMENT_NOT_FOUND', 'Đăng ký không tồn tại.', status_code=404)
         
         # Validate score
         score = float(data['score'])
-        if score < 0 or score > 10:
+        if not 0.0 <= score <= 10.0:
             return error_response(
                 'INVALID_SCORE',
                 'Điểm số phải trong khoảng 0-10.',
@@ -709,35 +887,24 @@ def update_student_grade(current_user):
             )
         
         # Convert score to grade
-        if score >= 8.5:
-            grade = 'A'
-            status = EnrollmentStatus.COMPLETED.value
-        elif score >= 7.0:
-            grade = 'B'
-            status = EnrollmentStatus.COMPLETED.value
-        elif score >= 5.5:
-            grade = 'C'
-            status = EnrollmentStatus.COMPLETED.value
-        elif score >= 4.0:
-            grade = 'D'
-            status = EnrollmentStatus.COMPLETED.value
-        else:
-            grade = 'F'
-            status = EnrollmentStatus.Failed.value
+        grade, status = _score_to_grade(score)
         
-        # Update enrollment
-        enrollment.score = score
-        enrollment.grade = grade
-        enrollment.status = status
+        # Update enrollment in place; the response is built from known values,
+        # so nothing has to be reloaded after the commit
+        Enrollment.query.filter_by(enrollment_id=enrollment.enrollment_id).update(
+            {'score': score, 'grade': grade, 'status': status},
+            synchronize_session=False
+        )
         
         db.session.commit()
+        _overview_counts.invalidate()
         
         return success_response(
             'Cập nhật điểm thành công.',
             {
                 'enrollment_id': enrollment.enrollment_id,
-                'student_name': enrollment.student.user.full_name,
-                'course_name': enrollment.class_ref.course.course_name,
+                'student_name': enrollment.full_name,
+                'course_name': enrollment.course_name,
                 'score': score,
                 'grade': grade,
                 'status': status
@@ -755,6 +922,41 @@ def update_student_grade(current_user):
             500
         )
 
+def _class_term_filters(semester, academic_year):
+    """Optional semester / academic year criteria on Class"""
+    criteria = []
+    if semester:
+        criteria.append(Class.semester == semester)
+    if academic_year:
+        criteria.append(Class.academic_year == academic_year)
+    return criteria
+
+def _counts_by_department(department_column, scope):
+    """{department_id: row count} for a model's department column, in one GROUP BY"""
+    stmt = select(department_column, func.count()).group_by(department_column)
+    if scope:
+        stmt = stmt.where(department_column.in_(scope))
+    return dict(db.session.execute(stmt).all())
+
+def _department_enrollments(stmt, scope, term, *criteria):
+    """Enrollments joined to their class and course, filtered by department scope and term"""
+    stmt = stmt.select_from(Enrollment)\
+        .join(Class, Enrollment.class_id == Class.class_id)\
+        .join(Course, Class.course_id == Course.course_id)\
+        .where(*term, *criteria)
+    if scope:
+        stmt = stmt.where(Course.department_id.in_(scope))
+    return stmt
+
+def _department_classes(stmt, scope, term, *criteria):
+    """Classes joined to their course, filtered by department scope and term"""
+    stmt = stmt.select_from(Class)\
+        .join(Course, Class.course_id == Course.course_id)\
+        .where(*term, *criteria)
+    if scope:
+        stmt = stmt.where(Course.department_id.in_(scope))
+    return stmt
+
 @manager_bp.route('/department-statistics', methods=['GET'])
 @manager_required
 def get_department_statistics(current_user):
@@ -768,7 +970,7 @@ def get_department_statistics(current_user):
         
         # Base query for statistics
         if department_id:
-            departments = [Department.query.get(department_id)]
+            departments = [db.session.get(Department, department_id)]
             if not departments[0]:
                 return error_response('DEPARTMENT_NOT_FOUND', 'Khoa không tồn tại.', status_code=404)
         elif department_name:
@@ -782,69 +984,59 @@ def get_department_statistics(current_user):
         else:
             departments = Department.query.all()
         
+        # Every count comes from one GROUP BY per metric, keyed by department,
+        # instead of a set of COUNT queries per department
+        # Department ids to restrict the counts to (none: all departments)
+        scope = [departments[0].department_id] if department_id or department_name else []
+        term = _class_term_filters(semester, academic_year)
+        
+        student_counts = _counts_by_department(Student.department_id, scope)
+        teacher_counts = _counts_by_department(Teacher.department_id, scope)
+        course_counts = _counts_by_department(Course.department_id, scope)
+        
+        class_counts = {}
+        class_stmt = _department_classes(
+            select(
+                Course.department_id,
+                func.count(),
+                func.sum(case((Class.status.in_((_CLASS_OPEN, _CLASS_IN_PROGRESS)), 1), else_=0))
+            ), scope, term
+        ).group_by(Course.department_id)
+        for dept_id, class_count, active_count in db.session.execute(class_stmt):
+            class_counts[dept_id] = (class_count, int(active_count or 0))
+        
+        enrollment_stmt = _department_enrollments(
+            select(Course.department_id, func.count()), scope, term,
+            Enrollment.status == _ENROLLMENT_REGISTERED
+        ).group_by(Course.department_id)
+        enrollment_counts = dict(db.session.execute(enrollment_stmt).all())
+        
+        grade_stats_by_dept = defaultdict(dict)
+        grade_stmt = _department_enrollments(
+            select(Course.department_id, Enrollment.grade, func.count()), scope, term,
+            Enrollment.status.in_(_ENROLLMENT_GRADED_STATUSES),
+            Enrollment.grade.isnot(None)
+        ).group_by(Course.department_id, Enrollment.grade)
+        for dept_id, grade, count in db.session.execute(grade_stmt):
+            grade_stats_by_dept[dept_id][grade] = count
+        
         statistics = []
         for dept in departments:
             if dept is None:
                 continue
-                
-            # Student count
-            student_count = Student.query.filter_by(department_id=dept.department_id).count()
-            
-            # Teacher count  
-            teacher_count = Teacher.query.filter_by(department_id=dept.department_id).count()
-            
-            # Course count
-            course_count = Course.query.filter_by(department_id=dept.department_id).count()
-            
-            # Class count with optional filtering
-            class_query = Class.query.join(Course).filter(Course.department_id == dept.department_id)
-            if semester:
-                class_query = class_query.filter(Class.semester == semester)
-            if academic_year:
-                class_query = class_query.filter(Class.academic_year == academic_year)
-            
-            class_count = class_query.count()
-            active_classes = class_query.filter(Class.status.in_([ClassStatus.OPEN, ClassStatus.IN_PROGRESS])).count()
-            
-            # Enrollment statistics
-            enrollment_query = Enrollment.query.join(Class).join(Course).filter(
-                Course.department_id == dept.department_id,
-                Enrollment.status == EnrollmentStatus.REGISTERED.value
-            )
-            if semester:
-                enrollment_query = enrollment_query.filter(Class.semester == semester)
-            if academic_year:
-                enrollment_query = enrollment_query.filter(Class.academic_year == academic_year)
-                
-            total_enrollments = enrollment_query.count()
-            
-            # Grade distribution
-            grade_stats = {}
-            completed_enrollments = Enrollment.query.join(Class).join(Course).filter(
-                Course.department_id == dept.department_id,
-                Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.Failed.value]),
-                Enrollment.grade.isnot(None)
-            )
-            if semester:
-                completed_enrollments = completed_enrollments.filter(Class.semester == semester)
-            if academic_year:
-                completed_enrollments = completed_enrollments.filter(Class.academic_year == academic_year)
             
-            for enrollment in completed_enrollments:
-                grade = enrollment.grade
-                if grade in grade_stats:
-                    grade_stats[grade] += 1
-                else:
-                    grade_stats[grade] = 1
+            dept_id = dept.department_id
+            class_count, active_classes = class_counts.get(dept_id, (0, 0))
+            grade_stats = grade_stats_by_dept.get(dept_id, {})
             
             dept_stats = {
                 'department_info': dept.to_dict(),
-                'student_count': student_count,
-                'teacher_count': teacher_count,
-                'course_count': course_count,
+                'student_count': student_counts.get(dept_id, 0),
+                'teacher_count': teacher_counts.get(dept_id, 0),
+                'course_count': course_counts.get(dept_id, 0),
                 'class_count': class_count,
                 'active_classes': active_classes,
-                'total_enrollments': total_enrollments,
+                'total_enrollments': enrollment_counts.get(dept_id, 0),
                 'grade_distribution': grade_stats,
                 'completion_rate': round(
                     (grade_stats.get('A', 0) + grade_stats.get('B', 0) + 
@@ -884,7 +1076,7 @@ def get_department_personnel_statistics(current_user):
 
         
         if department_id:
-            departments = [Department.query.get(department_id)]
+            departments = [db.session.get(Department, department_id)]
             if not departments[0]:
                 return error_response('DEPARTMENT_NOT_FOUND', 'Khoa không tồn tại.', status_code=404)
         elif department_name:
@@ -901,6 +1093,46 @@ def get_department_personnel_statistics(current_user):
         else:
             departments = Department.query.all()
         
+        # Every count comes from one GROUP BY per metric, keyed by department,
+        # instead of loading each department's students/teachers/courses
+        scope = [departments[0].department_id] if department_id or department_name else []
+        term = _class_term_filters(get_current_semester(), get_current_academic_year())
+        
+        major_distributions = defaultdict(dict)
+        major_stmt = select(Student.department_id, Student.major, func.count())\
+            .group_by(Student.department_id, Student.major)
+        if scope:
+            major_stmt = major_stmt.where(Student.department_id.in_(scope))
+        for dept_id, major, count in db.session.execute(major_stmt):
+            distribution = major_distributions[dept_id]
+            major = major or 'Chưa xác định'
+            distribution[major] = distribution.get(major, 0) + count
+        
+        teacher_counts = _counts_by_department(Teacher.department_id, scope)
+        
+        course_stmt = select(Course.department_id, func.count(), func.sum(Course.credits))\
+            .group_by(Course.department_id)
+        if scope:
+            course_stmt = course_stmt.where(Course.department_id.in_(scope))
+        course_stats = {
+            dept_id: (course_count, int(credits or 0))
+            for dept_id, course_count, credits in db.session.execute(course_stmt)
+        }
+        
+        # Active classes and enrollments this semester
+        active_class_counts = dict(db.session.execute(
+            _department_classes(
+                select(Course.department_id, func.count()), scope, term,
+                Class.status.in_((_CLASS_OPEN, _CLASS_IN_PROGRESS))
+            ).group_by(Course.department_id)
+        ).all())
+        enrollment_counts = dict(db.session.execute(
+            _department_enrollments(
+                select(Course.department_id, func.count()), scope, term,
+                Enrollment.status == _ENROLLMENT_REGISTERED
+            ).group_by(Course.department_id)
+        ).all())
+        
         personnel_statistics = []
         total_students = 0
         total_teachers = 0
@@ -909,42 +1141,13 @@ def get_department_personnel_statistics(current_user):
             if dept is None:
                 continue
             
-            # Student statistics
-            students = Student.query.filter_by(department_id=dept.department_id).all()
-            student_count = len(students)
-            
-            # Student by major distribution
-            major_distribution = {}
-            for student in students:
-                major = student.major or 'Chưa xác định'
-                major_distribution[major] = major_distribution.get(major, 0) + 1
-            
-            # Teacher statistics
-            teachers = Teacher.query.filter_by(department_id=dept.department_id).all()
-            teacher_count = len(teachers)
-            
-            # Course statistics
-            courses = Course.query.filter_by(department_id=dept.department_id).all()
-            total_credits = sum(course.credits for course in courses)
-            
-            # Active classes this semester
-            current_semester = get_current_semester()
-            current_academic_year = get_current_academic_year()
-            
-            active_classes = Class.query.join(Course).filter(
-                Course.department_id == dept.department_id,
-                Class.semester == current_semester,
-                Class.academic_year == current_academic_year,
-                Class.status.in_([ClassStatus.OPEN.value, ClassStatus.IN_PROGRESS.value])
-            ).count()
-            
-            # Enrollment statistics
-            current_enrollments = Enrollment.query.join(Class).join(Course).filter(
-                Course.department_id == dept.department_id,
-                Class.semester == current_semester,
-                Class.academic_year == current_academic_year,
-                Enrollment.status ==EnrollmentStatus.REGISTERED.value
-            ).count()
+            dept_id = dept.department_id
+            major_distribution = major_distributions.get(dept_id, {})
+            student_count = sum(major_distribution.values())
+            teacher_count = teacher_counts.get(dept_id, 0)
+            course_count, total_credits = course_stats.get(dept_id, (0, 0))
+            active_classes = active_class_counts.get(dept_id, 0)
+            current_enrollments = enrollment_counts.get(dept_id, 0)
             
             total_students += student_count
             total_teachers += teacher_count
@@ -963,7 +1166,7 @@ def get_department_personnel_statistics(current_user):
                     'student_teacher_ratio': round(student_count / teacher_count, 1) if teacher_count > 0 else 0
                 },
                 'academic_statistics': {
-                    'total_courses': len(courses),
+                    'total_courses': course_count,
                     'total_credits_offered': total_credits,
                     'active_classes_current_semester': active_classes,
                     'current_enrollments': current_enrollments
@@ -1009,7 +1212,7 @@ def get_class_offering_statistics(current_user):
             academic_year = get_current_academic_year()
         
         if department_id:
-            departments = [Department.query.get(department_id)]
+            departments = [db.session.get(Department, department_id)]
             if not departments[0]:
                 return error_response('DEPARTMENT_NOT_FOUND', 'Khoa không tồn tại.', status_code=404)
         elif department_name:
@@ -1048,9 +1251,9 @@ def get_class_offering_statistics(current_user):
             
             # Class status distribution
             status_distribution = {
-                ClassStatus.OPEN.value: 0,
-               ClassStatus.IN_PROGRESS.value: 0,
-                ClassStatus.COMPLETED.value: 0
+                _CLASS_OPEN: 0,
+               _CLASS_IN_PROGRESS: 0,
+                _CLASS_COMPLETED: 0
             }
             
             total_enrollment = 0
@@ -1085,7 +1288,7 @@ def get_class_offering_statistics(current_user):
                 # Teacher info
                 teacher_info = None
                 if class_obj.teacher_id:
-                    teacher = Teacher.query.get(class_obj.teacher_id)
+                    teacher = db.session.get(Teacher, class_obj.teacher_id)
                     if teacher:
                         teacher_info = {
                             'teacher_name': teacher.user.full_name,
@@ -1103,11 +1306,11 @@ def get_class_offering_statistics(current_user):
                     'class_status': class_status,
                     'course_status': class_obj.status,
                     'teacher_info': teacher_info,
-                    'start_date': class_obj.start_date.isoformat() if class_obj.start_date else None,
-                    'end_date': class_obj.end_date.isoformat() if class_obj.end_date else None
+                    'start_date': class_obj.start_date,
+                    'end_date': class_obj.end_date
                 })
             
-            open_classes = status_distribution.get(ClassStatus.OPEN.value, 0) + status_distribution.get(ClassStatus.IN_PROGRESS.value, 0)
+            open_classes = status_distribution.get(_CLASS_OPEN, 0) + status_distribution.get(_CLASS_IN_PROGRESS, 0)
             
             total_classes_all_depts += len(classes)
             total_open_classes_all_depts += open_classes
@@ -1184,7 +1387,7 @@ def validate_enrollment_conflicts(current_user):
         .join(Course, Class.course_id == Course.course_id)\
         .join(Department.alias(), Course.department_id == Department.department_id, isouter=True)\
         .filter(
-            Enrollment.status == EnrollmentStatus.REGISTERED.value,
+            Enrollment.status == _ENROLLMENT_REGISTERED,
             Student.department_id != Course.department_id
         ).all()
         
@@ -1259,12 +1462,13 @@ def export_department_report(current_user):
         academic_year = data.get('academic_year')
         export_format = data.get('format', 'json')  # json, csv options
         
-        if not department_id:
-                department = Department.query.get(department_name)
-
-        department = Department.query.get(department_id)
+        if department_id:
+            department = db.session.get(Department, department_id)
+        else:
+            department = Department.query.filter_by(department_name=department_name).first() if department_name else None
         if not department:
             return error_response('DEPARTMENT_NOT_FOUND', 'Khoa không tồn tại.', status_code=404)
+        department_id = department.department_id
         
         # Collect comprehensive department data
         students = Student.query.filter_by(department_id=department_id).all()
@@ -1302,7 +1506,7 @@ def export_department_report(current_user):
                         'full_name': s.user.full_name,
                         'email': s.user.email,
                         'major': s.major,
-                        'enrollment_date': s.enrollment_date.isoformat() if s.enrollment_date else None
+                        'enrollment_date': s.enrollment_date
                     } for s in students
                 ],
                 'teachers': [
@@ -1311,7 +1515,7 @@ def export_department_report(current_user):
                         'full_name': t.user.full_name,
                         'email': t.user.email,
                         'department': t.department,
-                        'hire_date': t.hire_date.isoformat() if t.hire_date else None
+                        'hire_date': t.hire_date
                     } for t in teachers
                 ],
                 'courses': [
@@ -1384,44 +1588,47 @@ def get_comprehensive_system_report(current_user):
         active_classes = Class.query.filter(
             Class.semester == semester,
             Class.academic_year == academic_year,
-            Class.status.in_([ClassStatus.OPEN.value, ClassStatus.IN_PROGRESS.value])
+            Class.status.in_([_CLASS_OPEN, _CLASS_IN_PROGRESS])
         ).count()
         
         current_enrollments = Enrollment.query.join(Class).filter(
             Class.semester == semester,
             Class.academic_year == academic_year,
-            Enrollment.status == EnrollmentStatus.REGISTERED.value
+            Enrollment.status == _ENROLLMENT_REGISTERED
         ).count()
         
-        # 3. Department-wise breakdown
+        # 3. Department-wise breakdown: one GROUP BY per metric, keyed by
+        # department, instead of five COUNT queries per department
+        term = _class_term_filters(semester, academic_year)
+        student_counts = _counts_by_department(Student.department_id, [])
+        teacher_counts = _counts_by_department(Teacher.department_id, [])
+        course_counts = _counts_by_department(Course.department_id, [])
+        class_counts = dict(db.session.execute(
+            _department_classes(select(Course.department_id, func.count()), [], term)
+            .group_by(Course.department_id)
+        ).all())
+        enrollment_counts = dict(db.session.execute(
+            _department_enrollments(
+                select(Course.department_id, func.count()), [], term,
+                Enrollment.status == _ENROLLMENT_REGISTERED
+            ).group_by(Course.department_id)
+        ).all())
+        
         departments = Department.query.all()
         department_breakdown = []
         
         for dept in departments:
-            dept_students = Student.query.filter_by(department_id=dept.department_id).count()
-            dept_teachers = Teacher.query.filter_by(department_id=dept.department_id).count()
-            dept_courses = Course.query.filter_by(department_id=dept.department_id).count()
-            
-            dept_classes_current = Class.query.join(Course).filter(
-                Course.department_id == dept.department_id,
-                Class.semester == semester,
-                Class.academic_year == academic_year
-            ).count()
-            
-            dept_enrollments_current = Enrollment.query.join(Class).join(Course).filter(
-                Course.department_id == dept.department_id,
-                Class.semester == semester,
-                Class.academic_year == academic_year,
-                Enrollment.status == EnrollmentStatus.REGISTERED.value
-            ).count()
+            dept_id = dept.department_id
+            dept_students = student_counts.get(dept_id, 0)
+            dept_teachers = teacher_counts.get(dept_id, 0)
             
             department_breakdown.append({
                 'department_name': dept.department_name,
                 'student_count': dept_students,
                 'teacher_count': dept_teachers,
-                'course_count': dept_courses,
-                'current_classes': dept_classes_current,
-                'current_enrollments': dept_enrollments_current,
+                'course_count': course_counts.get(dept_id, 0),
+                'current_classes': class_counts.get(dept_id, 0),
+                'current_enrollments': enrollment_counts.get(dept_id, 0),
                 'student_teacher_ratio': round(dept_students / dept_teachers, 1) if dept_teachers > 0 else 0
             })
         
@@ -1430,7 +1637,7 @@ def get_comprehensive_system_report(current_user):
         completed_enrollments = Enrollment.query.join(Class).filter(
             Class.semester == semester,
             Class.academic_year == academic_year,
-            Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.Failed.value]),
+            Enrollment.status.in_(_ENROLLMENT_GRADED_STATUSES),
             Enrollment.grade.isnot(None)
         ).all()
         
@@ -1449,22 +1656,17 @@ def get_comprehensive_system_report(current_user):
             Class.teacher_id.is_(None)
         ).count()
         
-        # Students without department
-        students_without_dept = Student.query.filter(
-            Student.department_id.is_(None)
-        ).count()
-        
-        # Teachers without department
-        teachers_without_dept = Teacher.query.filter(
-            Teacher.department_id.is_(None)
-        ).count()
+        # Students / teachers without department (the NULL group of the
+        # per-department counts above)
+        students_without_dept = student_counts.get(None, 0)
+        teachers_without_dept = teacher_counts.get(None, 0)
         
         # Under-enrolled classes (less than 50% capacity)
         under_enrolled = Class.query.filter(
             Class.semester == semester,
             Class.academic_year == academic_year,
             Class.current_enrollment < Class.max_capacity * 0.5,
-            Class.status.in_([ClassStatus.OPEN.value,ClassStatus.IN_PROGRESS.value])
+            Class.status.in_([_CLASS_OPEN,_CLASS_IN_PROGRESS])
         ).count()
         
         # 6. Trends (if historical data available)
@@ -1485,7 +1687,7 @@ def get_comprehensive_system_report(current_user):
             previous_semester_enrollments = Enrollment.query.join(Class).filter(
                 Class.semester == prev_semester,
                 Class.academic_year == prev_year,
-                Enrollment.status == EnrollmentStatus.REGISTERED.value
+                Enrollment.status == _ENROLLMENT_REGISTERED
             ).count()
         except:
             pass
@@ -4,13 +4,23 @@ from models import (
     db, Enrollment, Class, Course, Department,
     UserType, ClassStatus, EnrollmentStatus,Schedule,Teacher, User,Student
 )
+from sqlalchemy import exists, func
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 from decorators import student_required
 
 # Import helpers từ file helpers.py
-from .helpers import error_response, success_response, validate_class_timing_constraints, get_current_semester, get_current_academic_year, get_gpa_classification
+from .helpers import error_response, success_response, get_page_args, page_info, format_hhmm, validate_class_timing_constraints, get_current_semester, get_current_academic_year, get_gpa_classification
 
 student_bp = Blueprint('student', __name__)
 
+# Request-independent constants, built once at import time
+_USER_STUDENT = UserType.STUDENT.value
+_CLASS_OPEN = ClassStatus.OPEN.value
+_CANCELLABLE_CLASS_STATUSES = frozenset((ClassStatus.OPEN.value, ClassStatus.IN_PROGRESS.value))
+_ENROLLMENT_REGISTERED = EnrollmentStatus.REGISTERED.value
+_ENROLLMENT_CANCELLED = EnrollmentStatus.CANCELLED.value
+_ENROLLMENT_FINISHED_STATUSES = (EnrollmentStatus.COMPLETED.value, EnrollmentStatus.FAILED.value)
+
 # ====================== STUDENT ROUTES ======================
 
 
@@ -22,8 +32,11 @@ def get_student_schedule(current_user):
         if not current_user.student:
             return jsonify({'message': 'Student profile not found'}), 404
         
-        # Get student's enrolled classes with schedules
-        enrollments = Enrollment.query.filter_by(
+        # Get student's enrolled classes with course and schedules eager-loaded
+        enrollments = Enrollment.query.options(
+            joinedload(Enrollment.class_ref).joinedload(Class.course),
+            joinedload(Enrollment.class_ref).selectinload(Class.schedules)
+        ).filter_by(
             student_id=current_user.student.student_id,
             status=EnrollmentStatus.REGISTERED.value
         ).all()
@@ -32,21 +45,22 @@ def get_student_schedule(current_user):
         for enrollment in enrollments:
             class_obj = enrollment.class_ref
             course = class_obj.course
-            schedules = class_obj.schedules
+            # Class/course fields are read once per class, not once per session
+            class_id, semester, academic_year = class_obj.class_id, class_obj.semester, class_obj.academic_year
+            course_code, course_name, credits = course.course_code, course.course_name, course.credits
             
-            for schedule in schedules:
-                schedule_data.append({
-                    'class_id': class_obj.class_id,
-                    'course_code': course.course_code,
-                    'course_name': course.course_name,
-                    'credits': course.credits,
-                    'day_of_week': schedule.day_of_week,
-                    'start_time': schedule.start_time.strftime('%H:%M') if schedule.start_time else None,
-                    'end_time': schedule.end_time.strftime('%H:%M') if schedule.end_time else None,
-                    'room_location': schedule.room_location,
-                    'semester': class_obj.semester,
-                    'academic_year': class_obj.academic_year
-                })
+            schedule_data.extend({
+                'class_id': class_id,
+                'course_code': course_code,
+                'course_name': course_name,
+                'credits': credits,
+                'day_of_week': schedule.day_of_week,
+                'start_time': format_hhmm(schedule.start_time),
+                'end_time': format_hhmm(schedule.end_time),
+                'room_location': schedule.room_location,
+                'semester': semester,
+                'academic_year': academic_year
+            } for schedule in class_obj.schedules)
         
         return jsonify({
             'schedule': schedule_data
@@ -68,21 +82,17 @@ def enroll_course(current_user):
         if not current_user.student:
             return error_response('STUDENT_NOT_FOUND', 'Hồ sơ sinh viên không tồn tại.', status_code=404)
         
-        class_obj = Class.query.get(data['class_id'])
+        class_obj = db.session.get(Class, data['class_id'])
         if not class_obj:
             return error_response('CLASS_NOT_FOUND', 'Lớp học không tồn tại.', status_code=404)
         
         # Check class status
-        if class_obj.status !=ClassStatus.OPEN.value:
+        if class_obj.status != _CLASS_OPEN:
             return error_response('CLASS_NOT_OPEN', f'Lớp học không mở để đăng ký. Trạng thái hiện tại: {class_obj.status}')
         
-        # Check capacity
-        if class_obj.current_enrollment >= class_obj.max_capacity:
-            return error_response('CLASS_FULL', 'Lớp học đã đầy.')
-        
         # Validate timing constraints
         is_valid, error_code, error_msg = validate_class_timing_constraints(
-            class_obj, UserType.STUDENT.value, current_user
+            class_obj, _USER_STUDENT, current_user
         )
         if not is_valid:
             return error_response(error_code, error_msg)
@@ -101,8 +111,8 @@ def enroll_course(current_user):
             )
         
         if current_user.student.department_id != class_obj.course.department_id:
-            student_dept = Department.query.get(current_user.student.department_id)
-            course_dept = Department.query.get(class_obj.course.department_id)
+            student_dept = db.session.get(Department, current_user.student.department_id)
+            course_dept = db.session.get(Department, class_obj.course.department_id)
             return error_response(
                 'DEPARTMENT_MISMATCH',
                 'Bạn chỉ có thể đăng ký các lớp học thuộc khoa của mình.',
@@ -121,9 +131,9 @@ def enroll_course(current_user):
         ).first()
         
         if existing_enrollment:
-            if existing_enrollment.status == EnrollmentStatus.REGISTERED.value:
+            if existing_enrollment.status == _ENROLLMENT_REGISTERED:
                 return error_response('ALREADY_ENROLLED', 'Bạn đã đăng ký lớp học này.', status_code=409)
-            elif existing_enrollment.status in ['Đã hoàn thành', 'Rớt môn']:
+            elif existing_enrollment.status in _ENROLLMENT_FINISHED_STATUSES:
                 return error_response(
                     'COURSE_COMPLETED',
                     f'Bạn đã hoàn thành môn học này với trạng thái: {existing_enrollment.status}',
@@ -131,7 +141,7 @@ def enroll_course(current_user):
                 )
             else:
                 # Re-enroll if previously cancelled
-                existing_enrollment.status = EnrollmentStatus.REGISTERED.value
+                existing_enrollment.status = _ENROLLMENT_REGISTERED
                 existing_enrollment.enrollment_date = datetime.utcnow()
                 existing_enrollment.cancellation_date = None
         else:
@@ -139,13 +149,24 @@ def enroll_course(current_user):
             enrollment = Enrollment(
                 student_id=current_user.student.student_id,
                 class_id=data['class_id'],
-                status=EnrollmentStatus.REGISTERED.value,
+                status=_ENROLLMENT_REGISTERED,
                 enrollment_date=datetime.utcnow()
             )
             db.session.add(enrollment)
         
-        # Update class enrollment count
-        class_obj.current_enrollment += 1
+        # Claim a seat atomically: the capacity/status check and the increment are
+        # one conditional UPDATE, so concurrent enrollments cannot overfill the class
+        updated = Class.query.filter(
+            Class.class_id == class_obj.class_id,
+            Class.current_enrollment < Class.max_capacity,
+            Class.status == _CLASS_OPEN
+        ).update(
+            {Class.current_enrollment: Class.current_enrollment + 1},
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.rollback()
+            return error_response('CLASS_FULL', 'Lớp học đã đầy.')
         db.session.commit()
         
         return success_response(
@@ -157,8 +178,8 @@ def enroll_course(current_user):
                     'course_code': class_obj.course.course_code,
                     'semester': class_obj.semester,
                     'academic_year': class_obj.academic_year,
-                    'start_date': class_obj.start_date.isoformat() if class_obj.start_date else None,
-                    'end_date': class_obj.end_date.isoformat() if class_obj.end_date else None
+                    'start_date': class_obj.start_date,
+                    'end_date': class_obj.end_date
                 }
             }
         )
@@ -185,12 +206,12 @@ def cancel_enrollment(current_user):
         if not current_user.student:
             return error_response('STUDENT_NOT_FOUND', 'Hồ sơ sinh viên không tồn tại.', status_code=404)
         
-        class_obj = Class.query.get(data['class_id'])
+        class_obj = db.session.get(Class, data['class_id'])
         if not class_obj:
             return error_response('CLASS_NOT_FOUND', 'Lớp học không tồn tại.', status_code=404)
         
         # Check if class allows cancellation (must be in registration period)
-        if class_obj.status not in [ClassStatus.OPEN.value,ClassStatus.IN_PROGRESS.value]:
+        if class_obj.status not in _CANCELLABLE_CLASS_STATUSES:
             return error_response(
                 'CANCELLATION_NOT_ALLOWED',
                 f'Không thể hủy đăng ký vì lớp học đã {class_obj.status.lower()}.',
@@ -201,7 +222,7 @@ def cancel_enrollment(current_user):
         enrollment = Enrollment.query.filter_by(
             student_id=current_user.student.student_id,
             class_id=data['class_id'],
-            status=EnrollmentStatus.REGISTERED.value
+            status=_ENROLLMENT_REGISTERED
         ).first()
         
         if not enrollment:
@@ -253,11 +274,17 @@ def cancel_enrollment(current_user):
             )
         
         # Update enrollment status
-        enrollment.status = EnrollmentStatus.CANCELLED.value
+        enrollment.status = _ENROLLMENT_CANCELLED
         enrollment.cancellation_date = datetime.utcnow()
         
-        # Decrement class enrollment count
-        class_obj.current_enrollment = max(0, class_obj.current_enrollment - 1)
+        # Decrement class enrollment count in SQL (never below zero)
+        Class.query.filter(
+            Class.class_id == class_obj.class_id,
+            Class.current_enrollment > 0
+        ).update(
+            {Class.current_enrollment: Class.current_enrollment - 1},
+            synchronize_session=False
+        )
         
         db.session.commit()
         
@@ -302,10 +329,23 @@ def get_available_classes(current_user):
         current_academic_year = get_current_academic_year()
         current_date = datetime.utcnow().date()
         
-        # Query for available classes with strict filtering
-        query = Class.query.join(Course).filter(
+        # Classes the student is already registered in are excluded in SQL
+        already_enrolled = exists().where(
+            Enrollment.class_id == Class.class_id,
+            Enrollment.student_id == current_user.student.student_id,
+            Enrollment.status == _ENROLLMENT_REGISTERED
+        )
+        
+        # Query for available classes with strict filtering; course, department,
+        # teacher and schedules are loaded up front instead of per class
+        query = Class.query.join(Course).options(
+            contains_eager(Class.course).joinedload(Course.department),
+            joinedload(Class.teacher).joinedload(Teacher.user),
+            joinedload(Class.teacher).joinedload(Teacher.department),
+            selectinload(Class.schedules)
+        ).filter(
             # Basic availability criteria
-            Class.status == ClassStatus.OPEN.value,
+            Class.status == _CLASS_OPEN,
             Class.current_enrollment < Class.max_capacity,
             # Department match - CRITICAL CONSTRAINT
             Course.department_id == current_user.student.department_id,
@@ -313,51 +353,41 @@ def get_available_classes(current_user):
             Class.semester == current_semester,
             Class.academic_year == current_academic_year,
             # Registration should be before class starts
-            Class.start_date > current_date
+            Class.start_date > current_date,
+            ~already_enrolled
         )
         
-        available_classes = query.all()
+        page, per_page = get_page_args()
+        total = query.count()
+        available_classes = query.order_by(Class.class_id)\
+            .limit(per_page).offset((page - 1) * per_page).all()
         
         classes_data = []
-        enrolled_class_ids = set()
-        
-        # Get student's current enrollments
-        current_enrollments = Enrollment.query.filter_by(
-            student_id=current_user.student.student_id,
-            status=EnrollmentStatus.REGISTERED.value
-        ).all()
-        enrolled_class_ids = {e.class_id for e in current_enrollments}
-        
         for class_obj in available_classes:
-            # Skip already enrolled classes
-            if class_obj.class_id in enrolled_class_ids:
-                continue
-            
             class_data = class_obj.to_dict()
             class_data['course_info'] = class_obj.course.to_dict()
             
             # Add department info
-            department = Department.query.get(class_obj.course.department_id)
+            department = class_obj.course.department
             class_data['department_info'] = department.to_dict() if department else None
             
             # Add teacher info
-            if class_obj.teacher_id:
-                teacher = Teacher.query.get(class_obj.teacher_id)
-                if teacher:
-                    class_data['teacher_info'] = {
-                        'teacher_id': teacher.teacher_id,
-                        'teacher_name': teacher.user.full_name,
-                        'teacher_code': teacher.teacher_code,
-                        'department': teacher.department
-                    }
+            teacher = class_obj.teacher
+            if teacher:
+                class_data['teacher_info'] = {
+                    'teacher_id': teacher.teacher_id,
+                    'teacher_name': teacher.user.full_name,
+                    'teacher_code': teacher.teacher_code,
+                    'department': teacher.department.department_name if teacher.department else None
+                }
             
             # Add schedule info
-            schedules = Schedule.query.filter_by(class_id=class_obj.class_id).all()
+            schedules = class_obj.schedules
             class_data['schedules'] = [
                 {
                     'day_of_week': s.day_of_week,
-                    'start_time': s.start_time.strftime('%H:%M') if s.start_time else None,
-                    'end_time': s.end_time.strftime('%H:%M') if s.end_time else None,
+                    'start_time': format_hhmm(s.start_time),
+                    'end_time': format_hhmm(s.end_time),
                     'room_location': s.room_location
                 } for s in schedules
             ]
@@ -365,14 +395,15 @@ def get_available_classes(current_user):
             classes_data.append(class_data)
         
         # Add summary information
-        student_department = Department.query.get(current_user.student.department_id)
+        student_department = db.session.get(Department, current_user.student.department_id)
         
         return success_response(
             'Lấy danh sách lớp học thành công.',
             {
                 'available_classes': classes_data,
+                'pagination': page_info(page, per_page, total),
                 'summary': {
-                    'total_available': len(classes_data),
+                    'total_available': total,
                     'student_department': student_department.department_name if student_department else None,
                     'current_semester': current_semester,
                     'current_academic_year': current_academic_year
@@ -399,10 +430,12 @@ def get_student_gpa_by_semester(current_user):
         semester = request.args.get('semester')
         academic_year = request.args.get('academic_year')
         
-        # Base query for student's completed enrollments
-        query = Enrollment.query.join(Class).join(Course).filter(
+        # Base query for student's completed enrollments (class and course come from the join)
+        query = Enrollment.query.join(Class).join(Course).options(
+            contains_eager(Enrollment.class_ref).contains_eager(Class.course)
+        ).filter(
             Enrollment.student_id == current_user.student.student_id,
-            Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.Failed.value]),
+            Enrollment.status.in_(_ENROLLMENT_FINISHED_STATUSES),
             Enrollment.score.isnot(None)
         )
         
@@ -429,6 +462,18 @@ def get_student_gpa_by_semester(current_user):
                 }
             )
         
+        # Class averages for comparison, aggregated in one GROUP BY query
+        class_stats = {
+            class_id: (average, size)
+            for class_id, average, size in db.session.query(
+                Enrollment.class_id, func.avg(Enrollment.score), func.count(Enrollment.score)
+            ).filter(
+                Enrollment.class_id.in_({e.class_id for e in enrollments}),
+                Enrollment.status.in_(_ENROLLMENT_FINISHED_STATUSES),
+                Enrollment.score.isnot(None)
+            ).group_by(Enrollment.class_id)
+        }
+        
         # Calculate student GPA
         total_points = 0
         total_credits = 0
@@ -439,15 +484,8 @@ def get_student_gpa_by_semester(current_user):
             credits = course.credits
             score = enrollment.score
             
-            # Calculate class average for comparison
-            class_enrollments = Enrollment.query.filter(
-                Enrollment.class_id == enrollment.class_id,
-                Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.Failed.value]),
-                Enrollment.score.isnot(None)
-            ).all()
-            
-            class_scores = [e.score for e in class_enrollments if e.score is not None]
-            class_average = sum(class_scores) / len(class_scores) if class_scores else 0
+            class_average, class_size = class_stats.get(enrollment.class_id, (None, 0))
+            class_average = float(class_average) if class_average is not None else 0
             
             total_points += score * credits
             total_credits += credits
@@ -459,7 +497,7 @@ def get_student_gpa_by_semester(current_user):
                 'student_score': score,
                 'student_grade': enrollment.grade,
                 'class_average': round(class_average, 2),
-                'class_size': len(class_scores),
+                'class_size': class_size,
                 'performance_vs_class': 'Trên trung bình' if score > class_average else 'Dưới trung bình' if score < class_average else 'Bằng trung bình',
                 'semester': enrollment.class_ref.semester,
                 'academic_year': enrollment.class_ref.academic_year
@@ -509,7 +547,7 @@ def get_student_course_progress(current_user):
         # Get student's completed courses
         completed_enrollments = Enrollment.query.join(Class).join(Course).filter(
             Enrollment.student_id == current_user.student.student_id,
-            Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.Failed.value]),
+            Enrollment.status.in_(_ENROLLMENT_FINISHED_STATUSES),
             Course.department_id == current_user.student.department_id
         ).all()
         
@@ -575,7 +613,7 @@ def get_student_course_progress(current_user):
         completion_percentage = (completed_credits / total_credits_required * 100) if total_credits_required > 0 else 0
         pass_percentage = (passed_credits / total_credits_required * 100) if total_credits_required > 0 else 0
         
-        department = Department.query.get(current_user.student.department_id)
+        department = db.session.get(Department, current_user.student.department_id)
         
         return success_response(
             'Lấy tiến độ học tập thành công.',
@@ -1,15 +1,20 @@
+from collections import defaultdict
 from flask import Blueprint, request, jsonify
 from models import (
     db, User, Student, Teacher, Course, Class, Schedule, Department,
     Enrollment, UserType, ClassStatus, EnrollmentStatus
 )
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 from decorators import teacher_required
 
 # Import helpers
-from .helpers import error_response, success_response
+from .helpers import error_response, success_response, get_page_args, page_info, format_hhmm
 
 teacher_bp = Blueprint('teacher', __name__)
 
+_ENROLLMENT_FINISHED_STATUSES = (EnrollmentStatus.COMPLETED.value, EnrollmentStatus.FAILED.value)
+
 # ====================== TEACHER ROUTES ======================
 
 
@@ -24,8 +29,11 @@ def get_teaching_schedule(current_user):
         semester = request.args.get('semester')
         academic_year = request.args.get('academic_year')
         
-        # Base query for teacher's classes
-        query = Class.query.filter_by(teacher_id=current_user.teacher.teacher_id)
+        # Base query for teacher's classes, with course and schedules eager-loaded
+        query = Class.query.options(
+            joinedload(Class.course),
+            selectinload(Class.schedules)
+        ).filter_by(teacher_id=current_user.teacher.teacher_id)
         
         # Filter by semester and academic year if provided
         if semester:
@@ -45,27 +53,29 @@ def get_teaching_schedule(current_user):
                 current_user.teacher.department_id != course.department_id):
                 continue  # Skip mismatched departments
             
-            schedules = Schedule.query.filter_by(class_id=class_obj.class_id).all()
+            # Class/course fields are built once per class, not once per session
+            class_fields = {
+                'class_id': class_obj.class_id,
+                'course_code': course.course_code,
+                'course_name': course.course_name,
+                'credits': course.credits,
+                'semester': class_obj.semester,
+                'academic_year': class_obj.academic_year,
+                'current_enrollment': class_obj.current_enrollment,
+                'max_capacity': class_obj.max_capacity,
+                'class_status': class_obj.status,
+                'start_date': class_obj.start_date,
+                'end_date': class_obj.end_date
+            }
             
-            for schedule in schedules:
-                schedule_data.append({
-                    'schedule_id': schedule.schedule_id,
-                    'class_id': class_obj.class_id,
-                    'course_code': course.course_code,
-                    'course_name': course.course_name,
-                    'credits': course.credits,
-                    'day_of_week': schedule.day_of_week,
-                    'start_time': schedule.start_time.strftime('%H:%M') if schedule.start_time else None,
-                    'end_time': schedule.end_time.strftime('%H:%M') if schedule.end_time else None,
-                    'room_location': schedule.room_location,
-                    'semester': class_obj.semester,
-                    'academic_year': class_obj.academic_year,
-                    'current_enrollment': class_obj.current_enrollment,
-                    'max_capacity': class_obj.max_capacity,
-                    'class_status': class_obj.status,
-                    'start_date': class_obj.start_date.isoformat() if class_obj.start_date else None,
-                    'end_date': class_obj.end_date.isoformat() if class_obj.end_date else None
-                })
+            schedule_data.extend({
+                'schedule_id': schedule.schedule_id,
+                'day_of_week': schedule.day_of_week,
+                'start_time': format_hhmm(schedule.start_time),
+                'end_time': format_hhmm(schedule.end_time),
+                'room_location': schedule.room_location,
+                **class_fields
+            } for schedule in class_obj.schedules)
         
         # Sort by day of week and start time
         day_order = {'Thứ 2': 1, 'Thứ 3': 2, 'Thứ 4': 3, 'Thứ 5': 4, 'Thứ 6': 5, 'Thứ 7': 6, 'Chủ nhật': 7}
@@ -99,44 +109,52 @@ def get_teacher_students(current_user):
         if not current_user.teacher:
             return jsonify({'message': 'Teacher profile not found'}), 404
         
-        # Get all students enrolled in teacher's classes
-        classes = Class.query.filter_by(teacher_id=current_user.teacher.teacher_id).all()
+        # Get all students enrolled in teacher's classes in one query, with
+        # class, course, student, user and department loaded alongside
+        enrollments = Enrollment.query.join(Class).options(
+            contains_eager(Enrollment.class_ref).joinedload(Class.course),
+            joinedload(Enrollment.student).joinedload(Student.user),
+            joinedload(Enrollment.student).joinedload(Student.department)
+        ).filter(
+            Class.teacher_id == current_user.teacher.teacher_id,
+            Enrollment.status == EnrollmentStatus.REGISTERED.value
+        ).order_by(Class.class_id, Enrollment.enrollment_id)
+        
+        page, per_page = get_page_args()
+        total = enrollments.count()
+        enrollments = enrollments.limit(per_page).offset((page - 1) * per_page).all()
         
         students_data = []
-        for class_obj in classes:
-            enrollments = Enrollment.query.filter_by(
-                class_id=class_obj.class_id,
-                status=EnrollmentStatus.REGISTERED.value
-            ).all()
+        for enrollment in enrollments:
+            class_obj = enrollment.class_ref
+            student = enrollment.student
+            student_data = {
+                'student_id': student.student_id,
+                'student_code': student.student_code,
+                'full_name': student.user.full_name,
+                'email': student.user.email,
+                'phone_number': student.user.phone_number,
+                'major': student.major,
+                'class_info': {
+                    'class_id': class_obj.class_id,
+                    'course_code': class_obj.course.course_code,
+                    'course_name': class_obj.course.course_name,
+                    'semester': class_obj.semester,
+                    'academic_year': class_obj.academic_year
+                },
+                'grade': enrollment.grade
+            }
             
-            for enrollment in enrollments:
-                student = enrollment.student
-                student_data = {
-                    'student_id': student.student_id,
-                    'student_code': student.student_code,
-                    'full_name': student.user.full_name,
-                    'email': student.user.email,
-                    'phone_number': student.user.phone_number,
-                    'major': student.major,
-                    'class_info': {
-                        'class_id': class_obj.class_id,
-                        'course_code': class_obj.course.course_code,
-                        'course_name': class_obj.course.course_name,
-                        'semester': class_obj.semester,
-                        'academic_year': class_obj.academic_year
-                    },
-                    'grade': enrollment.grade
-                }
-                
-                # Add department info
-                if student.department_id:
-                    department = Department.query.get(student.department_id)
-                    student_data['department_info'] = department.to_dict() if department else None
-                
-                students_data.append(student_data)
+            # Add department info
+            if student.department_id:
+                department = student.department
+                student_data['department_info'] = department.to_dict() if department else None
+            
+            students_data.append(student_data)
         
         return jsonify({
-            'students': students_data
+            'students': students_data,
+            'pagination': page_info(page, per_page, total)
         }), 200
         
     except Exception as e:
@@ -150,39 +168,47 @@ def get_teacher_courses(current_user):
         if not current_user.teacher:
             return jsonify({'message': 'Teacher profile not found'}), 404
         
-        # Get teacher's classes and their courses
-        classes = Class.query.filter_by(teacher_id=current_user.teacher.teacher_id).all()
+        teacher_id = current_user.teacher.teacher_id
+        page, per_page = get_page_args()
+        
+        # Page over the distinct courses the teacher teaches (with department);
+        # each course's classes of this teacher are grouped by the ORM from one
+        # IN query instead of re-scanning a flat class list per course
+        course_query = Course.query.options(
+            joinedload(Course.department),
+            selectinload(Course.classes.and_(Class.teacher_id == teacher_id))
+        ).filter(
+            Course.course_id.in_(select(Class.course_id).where(Class.teacher_id == teacher_id))
+        ).order_by(Course.course_id)
+        total = course_query.count()
+        courses = course_query.limit(per_page).offset((page - 1) * per_page).all()
         
         courses_data = []
-        course_ids = set()
-        
-        for class_obj in classes:
-            if class_obj.course_id not in course_ids:
-                course_ids.add(class_obj.course_id)
-                course_data = class_obj.course.to_dict()
-                
-                # Add department info
-                if class_obj.course.department_id:
-                    department = Department.query.get(class_obj.course.department_id)
-                    course_data['department_info'] = department.to_dict() if department else None
-                
-                # Add class information
-                course_classes = [c for c in classes if c.course_id == class_obj.course_id]
-                course_data['classes'] = [
-                    {
-                        'class_id': c.class_id,
-                        'semester': c.semester,
-                        'academic_year': c.academic_year,
-                        'current_enrollment': c.current_enrollment,
-                        'max_capacity': c.max_capacity,
-                        'status': c.status
-                    } for c in course_classes
-                ]
-                
-                courses_data.append(course_data)
+        for course in courses:
+            course_data = course.to_dict()
+            
+            # Add department info
+            if course.department_id:
+                department = course.department
+                course_data['department_info'] = department.to_dict() if department else None
+            
+            # Add class information
+            course_data['classes'] = [
+                {
+                    'class_id': c.class_id,
+                    'semester': c.semester,
+                    'academic_year': c.academic_year,
+                    'current_enrollment': c.current_enrollment,
+                    'max_capacity': c.max_capacity,
+                    'status': c.status
+                } for c in course.classes
+            ]
+            
+            courses_data.append(course_data)
         
         return jsonify({
-            'courses': courses_data
+            'courses': courses_data,
+            'pagination': page_info(page, per_page, total)
         }), 200
         
     except Exception as e:
@@ -200,8 +226,9 @@ def get_student_grades_analysis(current_user):
         semester = request.args.get('semester')
         academic_year = request.args.get('academic_year')
         
-        # Get teacher's classes
-        query = Class.query.filter_by(teacher_id=current_user.teacher.teacher_id)
+        # Get teacher's classes (courses batch-loaded with one IN query)
+        query = Class.query.options(selectinload(Class.course))\
+            .filter_by(teacher_id=current_user.teacher.teacher_id)
         
         if class_id:
             query = query.filter_by(class_id=class_id)
@@ -212,15 +239,22 @@ def get_student_grades_analysis(current_user):
             
         classes = query.all()
         
+        # Graded enrollments of all those classes at once, with student, user and department
+        graded_by_class = defaultdict(list)
+        for enrollment in Enrollment.query.options(
+            selectinload(Enrollment.student).selectinload(Student.user),
+            selectinload(Enrollment.student).selectinload(Student.department)
+        ).filter(
+            Enrollment.class_id.in_([c.class_id for c in classes]),
+            Enrollment.status.in_(_ENROLLMENT_FINISHED_STATUSES),
+            Enrollment.score.isnot(None)
+        ):
+            graded_by_class[enrollment.class_id].append(enrollment)
+        
         class_grade_analysis = []
         
         for class_obj in classes:
-            # Get graded enrollments
-            graded_enrollments = Enrollment.query.filter(
-                Enrollment.class_id == class_obj.class_id,
-                Enrollment.status.in_([EnrollmentStatus.COMPLETED.value, EnrollmentStatus.FAILED.value]),
-                Enrollment.score.isnot(None)
-            ).all()
+            graded_enrollments = graded_by_class[class_obj.class_id]
             
             if not graded_enrollments:
                 class_grade_analysis.append({
@@ -257,7 +291,7 @@ def get_student_grades_analysis(current_user):
             student_grades = []
             for enrollment in graded_enrollments:
                 student = enrollment.student
-                department = Department.query.get(student.department_id) if student.department_id else None
+                department = student.department if student.department_id else None
                 student_grades.append({
                     'student_id': student.student_id,
                     'student_code': student.student_code,
@@ -321,8 +355,9 @@ def get_class_enrollment_statistics(current_user):
         semester = request.args.get('semester')
         academic_year = request.args.get('academic_year')
         
-        # Get teacher's classes
-        query = Class.query.filter_by(teacher_id=current_user.teacher.teacher_id)
+        # Get teacher's classes (courses batch-loaded with one IN query)
+        query = Class.query.options(selectinload(Class.course))\
+            .filter_by(teacher_id=current_user.teacher.teacher_id)
         
         if semester:
             query = query.filter_by(semester=semester)
@@ -337,12 +372,20 @@ def get_class_enrollment_statistics(current_user):
         total_students = 0
         total_capacity = 0
         
+        # Registered enrollments of all those classes at once, with student, user and department
+        enrolled_by_class = defaultdict(list)
+        for enrollment in Enrollment.query.options(
+            selectinload(Enrollment.student).selectinload(Student.user),
+            selectinload(Enrollment.student).selectinload(Student.department)
+        ).filter(
+            Enrollment.class_id.in_([c.class_id for c in classes]),
+            Enrollment.status == EnrollmentStatus.REGISTERED.value
+        ):
+            enrolled_by_class[enrollment.class_id].append(enrollment)
+        
         for class_obj in classes:
             # Get enrolled students
-            enrolled_students = Enrollment.query.filter_by(
-                class_id=class_obj.class_id,
-                status=EnrollmentStatus.REGISTERED.value
-            ).all()
+            enrolled_students = enrolled_by_class[class_obj.class_id]
             
             enrollment_percentage = (len(enrolled_students) / class_obj.max_capacity * 100) if class_obj.max_capacity > 0 else 0
             
@@ -362,7 +405,7 @@ def get_class_enrollment_statistics(current_user):
             student_list = []
             for enrollment in enrolled_students:
                 student = enrollment.student
-                department = Department.query.get(student.department_id) if student.department_id else None
+                department = student.department if student.department_id else None
                 student_list.append({
                     'student_id': student.student_id,
                     'student_code': student.student_code,